@@ -1,19 +1,118 @@
+import csv
+import json
+
+from django.conf import settings
 from django.contrib import admin
-from accounts.models import User, VerificationCode
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.db.models.functions import Now
+from django.http import StreamingHttpResponse
+from django.utils.functional import cached_property
+from accounts.models import User, VerificationCode, DeliveryJob, AvatarJob
 from django.utils.safestring import mark_safe
 
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for large tables. Rows are counted exactly up to
+    ADMIN_EXACT_COUNT_LIMIT; above that PostgreSQL's planner estimate is
+    used instead of a full COUNT(*), so the last page numbers are approximate.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        if connection.vendor != 'postgresql':
+            return super().count
+        # Подзапрос с LIMIT останавливается на limit + 1 строке
+        exact = queryset[:limit + 1].count()
+        if exact <= limit:
+            return exact
+        estimate = self.estimate(queryset, connection)
+        return estimate if estimate > limit else super().count
+
+    @staticmethod
+    def estimate(queryset, connection):
+        if not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                               [queryset.model._meta.db_table])
+                return cursor.fetchone()[0]
+        plan = json.loads(queryset.explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class Echo:
+    """File-like object for csv.writer that hands each line back instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist without exact counts, plus streaming CSV export of the selected or filtered rows."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['export_csv']
+    export_fields = ()
+
+    @admin.action(description='Выгрузить в CSV')
+    def export_csv(self, request, queryset):
+        writer = csv.writer(Echo())
+        rows = queryset.values_list(*self.export_fields).iterator(chunk_size=2000)
+        response = StreamingHttpResponse(self.stream(writer, rows), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{queryset.model._meta.model_name}.csv"'
+        return response
+
+    def stream(self, writer, rows):
+        yield writer.writerow(self.export_fields)
+        for row in rows:
+            yield writer.writerow(row)
+
+
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(LargeTableAdmin):
     readonly_fields = ('created_at', 'updated_at','email_verified_at','phone_verified_at')
     list_display = ('email','phone','status','is_admin')
     list_filter = ('status','created_at','is_active')
-    search_fields = ('created_at','email','phone')
+    # Поиск по началу строки: использует индексы UPPER(...) text_pattern_ops, а не полный просмотр таблицы
+    search_fields = ('^email','^phone')
+    export_fields = ('id','email','phone','first_name','last_name','status','is_active','created_at')
 
     def preview_avatar_image(self, obj):
         return mark_safe(f'<img src="{obj.avatar.url}"width="150"/>')
 
 
 @admin.register(VerificationCode)
-class VerificationCodeAdmin(admin.ModelAdmin):
+class VerificationCodeAdmin(LargeTableAdmin):
     list_display = ('code','is_used','is_expired')
-    readonly_fields = ('created_at','expired_at')
\ No newline at end of file
+    readonly_fields = ('created_at','expired_at')
+    export_fields = ('id','destination','type','is_used','created_at','expired_at')
+
+    def get_queryset(self, request):
+        # Просрочку считает база в том же запросе, а не Python построчно
+        return super().get_queryset(request).annotate(
+            expired=ExpressionWrapper(Q(expired_at__lt=Now()), output_field=BooleanField()),
+        )
+
+    @admin.display(boolean=True, ordering='expired', description='Истёк')
+    def is_expired(self, obj):
+        return obj.expired
+
+
+@admin.register(DeliveryJob)
+class DeliveryJobAdmin(admin.ModelAdmin):
+    list_display = ('destination','channel','status','attempts','next_attempt_at')
+    list_filter = ('status','channel')
+    readonly_fields = ('created_at','sent_at','locked_at','last_error')
+
+
+@admin.register(AvatarJob)
+class AvatarJobAdmin(admin.ModelAdmin):
+    list_display = ('user','name','attempts','locked_at','created_at')
+    raw_id_fields = ('user',)
+    readonly_fields = ('created_at',)
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from accounts import signals  # noqa: F401
+
+        from django.conf import settings
+        if settings.METRICS_ENABLED:
+            from django.db.backends.signals import connection_created
+            from accounts.metrics import install_db_wrapper
+            connection_created.connect(install_db_wrapper)
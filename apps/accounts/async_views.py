@@ -0,0 +1,241 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import JsonResponse as BaseJsonResponse
+from django.http.multipartparser import MultiPartParserError
+from django.utils import timezone
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+
+from accounts import delivery, hashing, profiles
+from accounts.authentication import CachedJWTAuthentication
+from accounts.backends import aget_user_by_contact
+from accounts.codes import get_code_store
+from accounts.ratelimit import ahit, client_ip, code_send_rules
+from accounts.serializers import CodeSerializer, LoginSerializerWithCode, LoginSerializerWithPassword, \
+    PasswordResetSerializer, RegistrationSerializer, UserProfileSerializer, check_code_status
+from accounts.tokens import RefreshToken
+from accounts.views import RATE_LIMIT_MESSAGES, generate_code
+
+
+class JsonResponse(BaseJsonResponse):
+    def __init__(self, data, **kwargs):
+        # Как и JSONRenderer в DRF, отдаём кириллицу без \u-экранирования
+        kwargs.setdefault('json_dumps_params', {'ensure_ascii': False})
+        super().__init__(data, **kwargs)
+
+
+def issue_tokens(user):
+    refresh = RefreshToken.for_user(user)
+    return {
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+    }
+
+
+class AsyncAPIView(View):
+    """
+    Async counterpart of the DRF views in accounts.views.
+
+    Handlers raise DRF exceptions as usual; they are rendered to the same
+    JSON bodies and status codes the sync views return.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as e:
+            detail = e.detail
+            if isinstance(detail, list):
+                detail = {api_settings.NON_FIELD_ERRORS_KEY: detail}
+            elif not isinstance(detail, dict):
+                detail = {'detail': detail}
+            return JsonResponse(detail, status=e.status_code)
+
+    def get_data(self, request):
+        if request.content_type == 'application/json':
+            try:
+                return json.loads(request.body or b'{}')
+            except ValueError:
+                raise exceptions.ParseError()
+        try:
+            if request.method != 'POST' and request.content_type == 'multipart/form-data':
+                # Django разбирает multipart только для POST; сохраняем в request, чтобы файлы закрылись с ним
+                request._post, request._files = request.parse_file_upload(request.META, request)
+            return request.POST.dict() | request.FILES.dict()
+        except MultiPartParserError as e:
+            raise exceptions.ParseError(str(e))
+
+    @staticmethod
+    def validate_fields(serializer_class, data):
+        """Run field-level validation only; the serializer's validate() may touch the DB."""
+        return serializer_class().to_internal_value(data)
+
+
+class AsyncCodeSendView(AsyncAPIView):
+    async def post(self, request):
+        data = self.get_data(request)
+        email = data.get('email')
+        phone = data.get('phone')
+
+        if not email and not phone:
+            raise exceptions.ValidationError('Укажите номер телефона или адрес электронной почты')
+
+        contact = email if email else phone
+        violated = await ahit(code_send_rules(contact, client_ip(request)))
+        if violated:
+            return JsonResponse({'message': RATE_LIMIT_MESSAGES[violated.name]}, status=429)
+
+        code = generate_code()
+        expiry = timezone.now() + timezone.timedelta(minutes=10)
+        channel = 'EMAIL' if email else 'PHONE'
+        # Код и задание на доставку записываются в одной транзакции, как в CodeSendView;
+        # отправка при CODE_DELIVERY_EAGER идёт уже после коммита, на event loop
+        job = await sync_to_async(self.issue)(contact, code, channel, expiry)
+        await delivery.adeliver(job)
+
+        return JsonResponse({
+            'message': 'Код подтверждения отправлен',
+            'expired_at': expiry,
+            'contact': contact,
+        })
+
+    @staticmethod
+    def issue(contact, code, channel, expiry):
+        with transaction.atomic():
+            get_code_store().issue(contact, code, channel, expiry)
+            return delivery.create_job(channel, contact, f'Ваш код подтверждения {code}')
+
+
+class AsyncLoginWithPasswordView(AsyncAPIView):
+    async def post(self, request):
+        attrs = self.validate_fields(LoginSerializerWithPassword, self.get_data(request))
+        email = attrs.get('email')
+        phone = attrs.get('phone')
+        if not email and not phone:
+            raise exceptions.ValidationError('Введите номер телефона или адрес электронной почты')
+
+        user = await aget_user_by_contact(email=email, phone=phone)
+        if user is None and email:
+            raise exceptions.ValidationError('Пользователя с такой почтой не существует')
+        if user is None:
+            raise exceptions.ValidationError('Пользователя с таким номером телефона не существует')
+        # Пароль проверяем и для неактивного пользователя, чтобы время ответа не выдавало его
+        verified = await hashing.averify_user_password(user, attrs['password'])
+        if not verified or not user.is_active:
+            raise exceptions.ValidationError('Неверные данные пользователя для входа')
+
+        return JsonResponse({
+            'message': 'Вход по паролю выполнен успешно',
+            'user_id': user.id,
+            'tokens': await sync_to_async(issue_tokens)(user),
+        })
+
+
+class AsyncLoginWithCodeView(AsyncAPIView):
+    async def post(self, request):
+        attrs = self.validate_fields(LoginSerializerWithCode, self.get_data(request))
+        email = attrs.get('email')
+        phone = attrs.get('phone')
+        if not email and not phone:
+            raise exceptions.ValidationError('Введите номер телефона или адрес электронной почты')
+
+        user = await aget_user_by_contact(email=email, phone=phone)
+        if user is None and email:
+            raise exceptions.ValidationError('Пользователя с такой почтой не существует')
+        if user is None:
+            raise exceptions.ValidationError('Пользователя с таким номером телефона не существует')
+
+        code_serializer = CodeSerializer(data={'code': attrs['code']})
+        if not code_serializer.is_valid():
+            raise exceptions.ValidationError(code_serializer.errors)
+        code_status = await get_code_store().aconsume(email if email else phone, attrs['code'])
+        check_code_status(code_status, 'Срок действия кода уже истек')
+
+        return JsonResponse({
+            'message': 'Вход по коду выполнен успешно',
+            'user_id': user.id,
+            'tokens': await sync_to_async(issue_tokens)(user),
+        })
+
+
+class AsyncRegisterView(AsyncAPIView):
+    async def post(self, request):
+        serializer = RegistrationSerializer(data=self.get_data(request))
+        # Проверки уникальности и кода - короткие запросы в общем потоке ORM; пароль хешируется
+        # в пуле accounts.hashing без занятия этого потока, и только потом идёт INSERT
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        attrs = dict(serializer.validated_data)
+        password = attrs.pop('password')
+        user = serializer.build_user(attrs)
+        await hashing.aset_password(user, password)
+        await sync_to_async(serializer.insert)(user)
+        return JsonResponse({
+            'message': 'Пользователь успешно создан',
+            'user_id': user.id,
+            'tokens': await sync_to_async(issue_tokens)(user),
+        }, status=201)
+
+
+class AsyncPasswordResetView(AsyncAPIView):
+    async def post(self, request):
+        serializer = PasswordResetSerializer(data=self.get_data(request))
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        attrs = serializer.validated_data
+        user = await aget_user_by_contact(email=attrs.get('email'), phone=attrs.get('phone'))
+        if user is None:
+            raise exceptions.ValidationError('Данного пользователя не существует')
+        if await hashing.acheck_password(attrs['new_password'], user.password):
+            raise exceptions.ValidationError('Пароли не должны совпадать ')
+        await hashing.aset_password(user, attrs['new_password'])
+        await sync_to_async(serializer.persist)(user)
+        return JsonResponse({
+            'message': 'Пароль успешно изменён',
+            'user_id': user.id,
+        })
+
+
+class AsyncUserProfileView(AsyncAPIView):
+    authentication = CachedJWTAuthentication()
+
+    async def get_user(self, request):
+        user = await self.authentication.aauthenticate(request)
+        if user is None:
+            raise exceptions.NotAuthenticated()
+        return await user.aget_full_user()
+
+    async def get(self, request):
+        snapshot = await self.authentication.aauthenticate(request)
+        if snapshot is None:
+            raise exceptions.NotAuthenticated()
+        response = profiles.not_modified(request, snapshot)
+        if response is not None:
+            return response
+        data = await profiles.aget_cached(snapshot, request)
+        if data is None:
+            user = await snapshot.aget_full_user()
+            data = UserProfileSerializer(user, context={'request': request}).data
+            await profiles.aset_cached(user, request, data)
+        return profiles.add_validators(JsonResponse(data), snapshot)
+
+    async def patch(self, request):
+        return await self.update(request, partial=True)
+
+    async def put(self, request):
+        return await self.update(request, partial=False)
+
+    async def update(self, request, partial):
+        user = await self.get_user(request)
+        serializer = UserProfileSerializer(user, data=self.get_data(request), partial=partial,
+                                           context={'request': request})
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        await sync_to_async(serializer.save)()
+        return profiles.add_validators(JsonResponse(serializer.data), user)
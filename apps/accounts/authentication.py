@@ -0,0 +1,201 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.permissions import BasePermission
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from accounts import metrics
+from accounts.models import User
+
+SNAPSHOT_FIELDS = ('id', 'email', 'phone', 'is_active', 'is_admin', 'is_superuser', 'status', 'updated_at')
+
+
+def snapshot_key(user_id):
+    return f'user_snapshot:{user_id}'
+
+
+def snapshot_version_key(user_id):
+    """
+    Token that every invalidation replaces; a snapshot is cached together
+    with the token read before its SELECT and is only accepted while the
+    token is unchanged, so a slow reader cannot put back a stale row.
+    """
+    return f'user_snapshot_version:{user_id}'
+
+
+class UserSnapshot:
+    """
+    Compact stand-in for User built from a cached row.
+
+    Snapshot columns are plain attributes; anything else loads the full
+    User row once and delegates to it.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, data):
+        self.__dict__.update(data)
+        self._full_user = None
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def is_staff(self):
+        return self.is_admin
+
+    def get_full_user(self):
+        if self._full_user is None:
+            self._full_user = User.objects.get(pk=self.id)
+        return self._full_user
+
+    async def aget_full_user(self):
+        if self._full_user is None:
+            self._full_user = await User.objects.aget(pk=self.id)
+        return self._full_user
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.get_full_user(), name)
+
+    def __str__(self):
+        return self.email or str(self.phone)
+
+
+def _cached_snapshot(values, user_id):
+    """The cached snapshot if it was stored under the current version, and that version."""
+    version = values.get(snapshot_version_key(user_id))
+    entry = values.get(snapshot_key(user_id))
+    if version is not None and entry is not None and entry[0] == version:
+        return entry[1], version
+    return None, version
+
+
+def get_user_snapshot(user_id):
+    keys = [snapshot_key(user_id), snapshot_version_key(user_id)]
+    with metrics.phase('cache'):
+        snapshot, version = _cached_snapshot(cache.get_many(keys), user_id)
+    if snapshot is not None:
+        return snapshot
+    if version is None:
+        # Версию фиксируем до чтения строки: инвалидация после этого момента сменит её,
+        # и снимок, прочитанный до изменения пользователя, уже не будет принят
+        with metrics.phase('cache'):
+            cache.add(keys[1], uuid.uuid4().hex, timeout=settings.USER_SNAPSHOT_TIMEOUT)
+            version = cache.get(keys[1])
+    snapshot = User.objects.filter(pk=user_id).values(*SNAPSHOT_FIELDS).first()
+    if snapshot is None:
+        return None
+    if version is not None:
+        with metrics.phase('cache'):
+            cache.set(keys[0], (version, snapshot), timeout=settings.USER_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+async def aget_user_snapshot(user_id):
+    keys = [snapshot_key(user_id), snapshot_version_key(user_id)]
+    with metrics.phase('cache'):
+        snapshot, version = _cached_snapshot(await cache.aget_many(keys), user_id)
+    if snapshot is not None:
+        return snapshot
+    if version is None:
+        with metrics.phase('cache'):
+            await cache.aadd(keys[1], uuid.uuid4().hex, timeout=settings.USER_SNAPSHOT_TIMEOUT)
+            version = await cache.aget(keys[1])
+    snapshot = await User.objects.filter(pk=user_id).values(*SNAPSHOT_FIELDS).afirst()
+    if snapshot is None:
+        return None
+    if version is not None:
+        with metrics.phase('cache'):
+            await cache.aset(keys[0], (version, snapshot), timeout=settings.USER_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that resolves the user from a cached snapshot instead of a SELECT per request."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        return self.user_from_snapshot(get_user_snapshot(user_id))
+
+    def get_validated_token(self, raw_token):
+        with metrics.phase('jwt'):
+            return super().get_validated_token(raw_token)
+
+    async def aauthenticate(self, request):
+        """Async counterpart of authenticate() for plain Django async views."""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        return self.user_from_snapshot(await aget_user_snapshot(user_id))
+
+    def user_from_snapshot(self, snapshot):
+        if snapshot is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if api_settings.CHECK_USER_IS_ACTIVE and not snapshot['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return UserSnapshot(snapshot)
+
+
+class ServiceClient:
+    """Another service of ours, authenticated by a token from SERVICE_TOKENS."""
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return f'service:{self.name}'
+
+
+class ServiceTokenAuthentication(BaseAuthentication):
+    """Authorization: Service <token>, for calls between our own services."""
+
+    keyword = b'service'
+
+    def authenticate(self, request):
+        parts = get_authorization_header(request).split()
+        if not parts or parts[0].lower() != self.keyword:
+            return None
+        if len(parts) != 2:
+            raise AuthenticationFailed(_('Invalid service token header'), code='bad_authorization_header')
+        token = parts[1].decode('latin-1')
+        # Сравниваем со всеми токенами, чтобы время ответа не выдавало совпадение
+        matched = None
+        for name, expected in settings.SERVICE_TOKENS.items():
+            if constant_time_compare(token, expected):
+                matched = name
+        if matched is None:
+            raise AuthenticationFailed(_('Invalid service token'), code='invalid_service_token')
+        return ServiceClient(matched), None
+
+    def authenticate_header(self, request):
+        return 'Service'
+
+
+class IsService(BasePermission):
+    def has_permission(self, request, view):
+        return isinstance(request.user, ServiceClient)
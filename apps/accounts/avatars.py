@@ -0,0 +1,248 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import FileUploadHandler
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.http.multipartparser import MultiPartParserError
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AVATAR = 'images/avatars/default.jpg'
+# Первые байты PNG и JPEG: проверка формата без декодирования картинки в потоке запроса
+SIGNATURES = (b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff')
+
+_executor = None
+_lock = threading.Lock()
+
+
+class SizeLimitUploadHandler(FileUploadHandler):
+    """Rejects a multipart upload as soon as it grows past AVATAR_MAX_UPLOAD_SIZE."""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.received = 0
+        # Заголовки формы занимают немного, поэтому заведомо большие запросы отсекаем сразу
+        if content_length and content_length > settings.AVATAR_MAX_UPLOAD_SIZE + 64 * 1024:
+            raise MultiPartParserError(self.too_large())
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.AVATAR_MAX_UPLOAD_SIZE:
+            raise MultiPartParserError(self.too_large())
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.received = 0
+        return None
+
+    @staticmethod
+    def too_large():
+        return f'Файл больше {settings.AVATAR_MAX_UPLOAD_SIZE // (1024 * 1024)} МБ'
+
+
+def has_image_signature(upload):
+    upload.seek(0)
+    head = upload.read(8)
+    upload.seek(0)
+    return head.startswith(SIGNATURES)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.AVATAR_WORKERS, thread_name_prefix='avatars')
+    return _executor
+
+
+@receiver(setting_changed)
+def reset_executor(setting, **kwargs):
+    global _executor
+    if setting == 'AVATAR_WORKERS':
+        with _lock:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = None
+
+
+def schedule(user_id, name, previous=None, previous_variants=None):
+    """
+    Store an AvatarJob and process it in this process once the transaction commits.
+
+    Call in the transaction that saves the upload. If the process exits
+    before the job is done, run_delivery_worker takes it over after
+    AVATAR_LOCK_TIMEOUT (see claim_jobs).
+    """
+    from accounts.models import AvatarJob
+
+    job = AvatarJob.objects.create(
+        user_id=user_id,
+        name=name,
+        previous=previous or '',
+        previous_variants=previous_variants or {},
+    )
+    transaction.on_commit(lambda: get_executor().submit(_run, job))
+    return job
+
+
+def claim_jobs(limit):
+    """Lock jobs abandoned for longer than AVATAR_LOCK_TIMEOUT and take them over."""
+    from accounts.models import AvatarJob
+
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.AVATAR_LOCK_TIMEOUT)
+    with transaction.atomic():
+        jobs = list(
+            AvatarJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(locked_at__lt=stale)
+            .order_by('locked_at')[:limit]
+        )
+        if jobs:
+            AvatarJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                locked_at=now,
+                attempts=F('attempts') + 1,
+            )
+    for job in jobs:
+        job.locked_at = now
+        job.attempts += 1
+    return jobs
+
+
+def run_job(job):
+    """
+    Process a claimed job and delete it. A failed job stays locked and is
+    retried after AVATAR_LOCK_TIMEOUT, up to AVATAR_MAX_ATTEMPTS times.
+    """
+    try:
+        process_avatar(job.user_id, job.name, job.previous, job.previous_variants)
+    except Exception:
+        logger.exception('Avatar job %s of user %s failed (attempt %s)', job.pk, job.user_id, job.attempts)
+        if job.attempts < settings.AVATAR_MAX_ATTEMPTS:
+            return
+    job.delete()
+
+
+def _run(job):
+    try:
+        run_job(job)
+    except Exception:
+        # Запрос уже завершён, поэтому ошибку только логируем
+        logger.exception('Avatar job %s failed', job.pk)
+    finally:
+        # Поток пула живёт долго, соединение с БД за ним не держим
+        connection.close()
+
+
+def process_avatar(user_id, name, previous=None, previous_variants=None):
+    """
+    Decode and validate the uploaded original, then store a JPEG and a WebP
+    variant for every size in AVATAR_SIZES.
+
+    An avatar that fails validation is replaced with the default one. Files
+    of the previous avatar are removed once the new avatar is in place.
+    Returns the variants, or None if the upload was rejected or replaced.
+    """
+    from accounts.models import User
+    from accounts.signals import invalidate_user
+
+    try:
+        variants = make_variants(user_id, name)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning('Avatar %s of user %s rejected: %s', name, user_id, e)
+        updated = User.objects.filter(pk=user_id, avatar=name).update(
+            avatar=DEFAULT_AVATAR, avatar_variants={}, updated_at=timezone.now(),
+        )
+        delete_files([name])
+        variants = None
+    else:
+        # Пока шла обработка, пользователь мог загрузить другую картинку
+        updated = User.objects.filter(pk=user_id, avatar=name).update(
+            avatar_variants=variants, updated_at=timezone.now(),
+        )
+        if not updated:
+            delete_files(variant_names(variants))
+            return None
+    if updated:
+        invalidate_user(user_id)
+    if updated and previous != name:
+        delete_files([previous, *variant_names(previous_variants or {})])
+    return variants
+
+
+def make_variants(user_id, name):
+    with default_storage.open(name) as f:
+        image = Image.open(f)
+        if image.format not in ('JPEG', 'PNG'):
+            raise ValueError(f'unsupported format {image.format}')
+        if image.width * image.height > settings.AVATAR_MAX_PIXELS:
+            raise ValueError(f'{image.width}x{image.height} is too large')
+        image.verify()
+
+    # verify() оставляет объект непригодным, поэтому открываем заново для декодирования
+    with default_storage.open(name) as f:
+        image = Image.open(f)
+        image.draft('RGB', (max(settings.AVATAR_SIZES.values()) * 2,) * 2)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    stem = os.path.splitext(os.path.basename(name))[0]
+    variants = {}
+    for label, size in settings.AVATAR_SIZES.items():
+        resized = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        variants[label] = {
+            'jpeg': save_variant(user_id, f'{stem}_{size}.jpg', flatten(resized), 'JPEG', quality=85, optimize=True,
+                                 progressive=True),
+            'webp': save_variant(user_id, f'{stem}_{size}.webp', resized, 'WEBP', quality=80, method=4),
+        }
+    return variants
+
+
+def flatten(image):
+    if image.mode != 'RGBA':
+        return image
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def save_variant(user_id, filename, image, format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format, **options)
+    return default_storage.save(f'images/avatars/variants/{user_id}/{filename}', ContentFile(buffer.getvalue()))
+
+
+def variant_names(variants):
+    return [name for formats in variants.values() for name in formats.values()]
+
+
+def delete_files(names):
+    for name in names:
+        if name and name != DEFAULT_AVATAR:
+            try:
+                default_storage.delete(name)
+            except OSError:
+                logger.warning('Could not delete %s', name)
+
+
+def variant_urls(variants, request=None):
+    urls = {}
+    for label, formats in variants.items():
+        urls[label] = {}
+        for format, name in formats.items():
+            url = default_storage.url(name)
+            urls[label][format] = request.build_absolute_uri(url) if request is not None else url
+    return urls
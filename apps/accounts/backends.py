@@ -0,0 +1,45 @@
+from django.contrib.auth.backends import ModelBackend
+
+from accounts import hashing
+from accounts.models import User
+
+
+def get_user_by_contact(email=None, phone=None):
+    try:
+        if email:
+            return User.objects.get(email=email)
+        if phone:
+            return User.objects.get(phone=phone)
+    except User.DoesNotExist:
+        pass
+    return None
+
+
+async def aget_user_by_contact(email=None, phone=None):
+    if email:
+        return await User.objects.filter(email=email).afirst()
+    if phone:
+        return await User.objects.filter(phone=phone).afirst()
+    return None
+
+
+class EmailOrPhoneBackend(ModelBackend):
+    """
+    Authenticates by email or phone with a password.
+
+    Callers that already loaded the user pass it as ``user`` so the row is
+    not fetched a second time.
+    """
+
+    def authenticate(self, request, email=None, phone=None, password=None, user=None, **kwargs):
+        if password is None:
+            return None
+        if user is None:
+            user = get_user_by_contact(email=email or kwargs.get(User.USERNAME_FIELD) or kwargs.get('username'), phone=phone)
+        if user is None:
+            # Хешируем пароль и для несуществующего пользователя, чтобы время ответа не выдавало его
+            hashing.make_password(password)
+            return None
+        if hashing.verify_user_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,168 @@
+import enum
+import hashlib
+import hmac
+import math
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from accounts import metrics
+from accounts.models import VerificationCode
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class CodeStatus(enum.Enum):
+    VALID = 'valid'
+    MISSING = 'missing'
+    EXPIRED = 'expired'
+
+
+class BaseCodeStore:
+    def issue(self, destination, code, type, expired_at):
+        raise NotImplementedError('subclasses of BaseCodeStore must override issue()')
+
+    def check(self, destination, code):
+        """Status of a code without consuming it, to reject bad codes before any expensive work."""
+        raise NotImplementedError('subclasses of BaseCodeStore must override check()')
+
+    def consume(self, destination, code):
+        """
+        Atomically mark an unused, unexpired code as used.
+
+        Returns CodeStatus.VALID if this call consumed the code, so of two
+        concurrent calls exactly one wins.
+        """
+        raise NotImplementedError('subclasses of BaseCodeStore must override consume()')
+
+    async def aissue(self, destination, code, type, expired_at):
+        return await sync_to_async(self.issue, thread_sensitive=False)(destination, code, type, expired_at)
+
+    async def aconsume(self, destination, code):
+        return await sync_to_async(self.consume, thread_sensitive=False)(destination, code)
+
+
+class ModelCodeStore(BaseCodeStore):
+    """Keeps codes in the VerificationCode table, visible in the admin."""
+
+    def issue(self, destination, code, type, expired_at):
+        VerificationCode.objects.create(
+            code=code,
+            destination=destination,
+            is_used=False,
+            expired_at=expired_at,
+            type=type,
+        )
+
+    def check(self, destination, code):
+        expired_at = (
+            VerificationCode.objects
+            .filter(destination=destination, code=code, is_used=False)
+            .order_by('-expired_at')
+            .values_list('expired_at', flat=True)
+            .first()
+        )
+        if expired_at is None:
+            return CodeStatus.MISSING
+        return CodeStatus.VALID if expired_at > timezone.now() else CodeStatus.EXPIRED
+
+    def consume(self, destination, code):
+        # Проверка срока и пометка кода одним условным UPDATE: конкурентный
+        # запрос дождется блокировки строки и уже не найдет is_used=False
+        consumed = VerificationCode.objects.filter(
+            destination=destination,
+            code=code,
+            is_used=False,
+            expired_at__gt=timezone.now()
+        ).update(is_used=True)
+        if consumed:
+            return CodeStatus.VALID
+        if VerificationCode.objects.filter(destination=destination, code=code, is_used=False).exists():
+            return CodeStatus.EXPIRED
+        return CodeStatus.MISSING
+
+    async def aissue(self, destination, code, type, expired_at):
+        await VerificationCode.objects.acreate(
+            code=code,
+            destination=destination,
+            is_used=False,
+            expired_at=expired_at,
+            type=type,
+        )
+
+    async def aconsume(self, destination, code):
+        consumed = await VerificationCode.objects.filter(
+            destination=destination,
+            code=code,
+            is_used=False,
+            expired_at__gt=timezone.now()
+        ).aupdate(is_used=True)
+        if consumed:
+            return CodeStatus.VALID
+        if await VerificationCode.objects.filter(destination=destination, code=code, is_used=False).aexists():
+            return CodeStatus.EXPIRED
+        return CodeStatus.MISSING
+
+
+class RedisCodeStore(BaseCodeStore):
+    """
+    Keeps codes in Redis under an HMAC of destination and code.
+
+    The key expires with the code and GETDEL consumes it in one round trip,
+    so an expired code is indistinguishable from a missing one.
+    """
+
+    key_prefix = 'vcode:'
+
+    def __init__(self, alias='default'):
+        from django_redis import get_redis_connection
+        self.client = get_redis_connection(alias)
+
+    def make_key(self, destination, code):
+        digest = hmac.new(
+            settings.SECRET_KEY.encode(),
+            f'{destination}:{code}'.encode(),
+            hashlib.sha256
+        ).hexdigest()
+        return f'{self.key_prefix}{digest}'
+
+    def issue(self, destination, code, type, expired_at):
+        ttl = math.ceil((expired_at - timezone.now()).total_seconds())
+        if ttl > 0:
+            with metrics.phase('cache'):
+                self.client.set(self.make_key(destination, code), type, ex=ttl)
+
+    def check(self, destination, code):
+        with metrics.phase('cache'):
+            exists = self.client.exists(self.make_key(destination, code))
+        return CodeStatus.VALID if exists else CodeStatus.MISSING
+
+    def consume(self, destination, code):
+        with metrics.phase('cache'):
+            value = self.client.getdel(self.make_key(destination, code))
+        if value is None:
+            return CodeStatus.MISSING
+        return CodeStatus.VALID
+
+
+def get_code_store():
+    """Return the process-wide store configured by VERIFICATION_CODE_STORE."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = import_string(settings.VERIFICATION_CODE_STORE)()
+    return _store
+
+
+@receiver(setting_changed)
+def reset_code_store(setting, **kwargs):
+    global _store
+    if setting == 'VERIFICATION_CODE_STORE':
+        _store = None
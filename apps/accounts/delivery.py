@@ -0,0 +1,154 @@
+import logging
+import random
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from accounts import metrics
+from accounts.models import DeliveryJob
+from accounts.utils import asend_on_phone_batch, send_on_email_batch, send_on_phone_batch
+
+logger = logging.getLogger(__name__)
+
+# Каждый отправитель принимает список (адресат, текст) и возвращает ошибки в том же порядке
+SENDERS = {
+    'EMAIL': send_on_email_batch,
+    'PHONE': send_on_phone_batch,
+}
+
+# То же для async-представлений; SMTP-клиент синхронный, поэтому почта уходит в поток
+ASYNC_SENDERS = {
+    'EMAIL': sync_to_async(send_on_email_batch, thread_sensitive=False),
+    'PHONE': asend_on_phone_batch,
+}
+
+# Имена фаз в accounts.metrics
+PHASES = {
+    'EMAIL': 'email',
+    'PHONE': 'sms',
+}
+
+
+def create_job(channel, destination, message):
+    """Store a delivery job; with CODE_DELIVERY_EAGER it is stored already claimed by the caller."""
+    if not settings.CODE_DELIVERY_EAGER:
+        return DeliveryJob.objects.create(
+            channel=channel,
+            destination=destination,
+            message=message,
+        )
+    return DeliveryJob.objects.create(
+        channel=channel,
+        destination=destination,
+        message=message,
+        status='SENDING',
+        attempts=1,
+        locked_at=timezone.now(),
+    )
+
+
+def enqueue(channel, destination, message):
+    """
+    Store a delivery job for the worker pool.
+
+    With CODE_DELIVERY_EAGER the job is claimed right away and sent in the
+    current process once the transaction commits.
+    """
+    job = create_job(channel, destination, message)
+    if settings.CODE_DELIVERY_EAGER:
+        transaction.on_commit(lambda: process_job(job))
+    return job
+
+
+async def adeliver(job):
+    """
+    Send a job made by create_job() from the event loop, once the transaction
+    that stored it has committed. Without CODE_DELIVERY_EAGER it is left to the worker.
+    """
+    if not settings.CODE_DELIVERY_EAGER:
+        return job
+    with metrics.phase(PHASES[job.channel]):
+        errors = await ASYNC_SENDERS[job.channel]([(job.destination, job.message)])
+    await job.asave(update_fields=_apply_result(job, errors[0]))
+    return job
+
+
+def backoff(attempts):
+    delay = min(settings.DELIVERY_BACKOFF_BASE * 2 ** (attempts - 1), settings.DELIVERY_BACKOFF_MAX)
+    return timedelta(seconds=delay + random.uniform(0, delay / 2))
+
+
+def claim_jobs(limit):
+    """
+    Lock a batch of due jobs and mark them SENDING.
+
+    Jobs stuck in SENDING longer than DELIVERY_LOCK_TIMEOUT (a worker died
+    mid-send) are picked up again.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.DELIVERY_LOCK_TIMEOUT)
+    with transaction.atomic():
+        jobs = list(
+            DeliveryJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                Q(status='PENDING', next_attempt_at__lte=now) |
+                Q(status='SENDING', locked_at__lt=stale)
+            )
+            .order_by('next_attempt_at')[:limit]
+        )
+        if jobs:
+            DeliveryJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status='SENDING',
+                locked_at=now,
+                attempts=F('attempts') + 1,
+            )
+    for job in jobs:
+        job.status = 'SENDING'
+        job.locked_at = now
+        job.attempts += 1
+    return jobs
+
+
+def process_jobs(jobs):
+    """Send claimed jobs in one batch per channel and record the outcome of each."""
+    for channel in SENDERS:
+        group = [job for job in jobs if job.channel == channel]
+        if group:
+            with metrics.phase(PHASES[channel]):
+                errors = SENDERS[channel]([(job.destination, job.message) for job in group])
+            for job, error in zip(group, errors):
+                _finish(job, error)
+    return jobs
+
+
+def process_job(job):
+    return process_jobs([job])[0]
+
+
+def _finish(job, error):
+    job.save(update_fields=_apply_result(job, error))
+
+
+def _apply_result(job, error):
+    if error is not None:
+        logger.warning('Delivery %s to %s failed (attempt %s): %s', job.pk, job.destination, job.attempts, error)
+        job.last_error = str(error)
+        if job.attempts >= settings.DELIVERY_MAX_ATTEMPTS:
+            job.status = 'FAILED'
+            # Повторов больше не будет, код в открытом виде не нужен
+            job.message = ''
+        else:
+            job.status = 'PENDING'
+            job.next_attempt_at = timezone.now() + backoff(job.attempts)
+    else:
+        job.status = 'SENT'
+        job.sent_at = timezone.now()
+        # Код больше не нужен после отправки, не храним его в открытом виде
+        job.message = ''
+    job.locked_at = None
+    return ['status', 'attempts', 'next_attempt_at', 'locked_at', 'last_error', 'sent_at', 'message']
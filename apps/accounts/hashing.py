@@ -0,0 +1,167 @@
+"""
+Password hashing in a bounded, process-wide pool.
+
+PASSWORD_HASHING_WORKERS caps how many hashes run at once, so a burst of
+logins queues instead of oversubscribing the CPU, and with
+PASSWORD_HASHING_EXECUTOR="process" the hashing runs outside the GIL.
+The sync helpers still block the calling thread on the result: they bound
+concurrency, they do not free the request thread. Only the async helpers
+release the caller (the event loop) while the hash runs.
+"""
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from accounts import metrics
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_waiting = 0
+_running = 0
+
+
+def _init_process():
+    import django
+    django.setup()
+
+
+def get_executor():
+    """
+    Return the process-wide hashing pool.
+
+    PASSWORD_HASHING_WORKERS bounds how many hashes run at once; further
+    requests wait for a free slot instead of oversubscribing the CPU.
+    """
+    global _executor, _slots
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                workers = settings.PASSWORD_HASHING_WORKERS
+                _slots = threading.BoundedSemaphore(workers)
+                if settings.PASSWORD_HASHING_EXECUTOR == 'process':
+                    _executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_process)
+                else:
+                    _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hashing')
+    return _executor
+
+
+def bulk_executor(workers=None):
+    """Separate process pool for batch jobs such as imports, so they do not queue behind login requests."""
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_process)
+
+
+def _track(delta_waiting, delta_running):
+    global _waiting, _running
+    with _stats_lock:
+        _waiting += delta_waiting
+        _running += delta_running
+
+
+def submit(fn, *args):
+    executor = get_executor()
+    slots = _slots
+    _track(1, 0)
+    slots.acquire()
+    _track(-1, 1)
+    future = executor.submit(fn, *args)
+
+    def release(_):
+        _track(0, -1)
+        slots.release()
+
+    future.add_done_callback(release)
+    return future
+
+
+def stats():
+    return {
+        'workers': settings.PASSWORD_HASHING_WORKERS,
+        'executor': settings.PASSWORD_HASHING_EXECUTOR,
+        'waiting': _waiting,
+        'running': _running,
+    }
+
+
+def make_password(password):
+    with metrics.phase('hashing'):
+        return submit(hashers.make_password, password).result()
+
+
+def check_password(password, encoded):
+    with metrics.phase('hashing'):
+        return submit(hashers.check_password, password, encoded).result()
+
+
+async def amake_password(password):
+    with metrics.phase('hashing'):
+        # Ожидание свободного слота блокирует поток, поэтому не на event loop
+        future = await asyncio.to_thread(submit, hashers.make_password, password)
+        return await asyncio.wrap_future(future)
+
+
+async def acheck_password(password, encoded):
+    with metrics.phase('hashing'):
+        future = await asyncio.to_thread(submit, hashers.check_password, password, encoded)
+        return await asyncio.wrap_future(future)
+
+
+def needs_upgrade(encoded):
+    """Whether a stored hash uses an outdated hasher or work factor."""
+    if not hashers.is_password_usable(encoded):
+        return False
+    preferred = hashers.get_hasher('default')
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def set_password(user, raw_password):
+    """AbstractBaseUser.set_password() through the hashing pool."""
+    user.password = make_password(raw_password)
+    user._password = raw_password
+
+
+def verify_user_password(user, raw_password):
+    """
+    AbstractBaseUser.check_password() through the hashing pool: on success a
+    hash made with outdated parameters is upgraded in place.
+    """
+    if not check_password(raw_password, user.password):
+        return False
+    if needs_upgrade(user.password):
+        set_password(user, raw_password)
+        user.save(update_fields=['password'])
+    return True
+
+
+async def aset_password(user, raw_password):
+    user.password = await amake_password(raw_password)
+    user._password = raw_password
+
+
+async def averify_user_password(user, raw_password):
+    if not await acheck_password(raw_password, user.password):
+        return False
+    if needs_upgrade(user.password):
+        await aset_password(user, raw_password)
+        await user.asave(update_fields=['password'])
+    return True
+
+
+@receiver(setting_changed)
+def reset_executor(setting, **kwargs):
+    global _executor
+    if setting.startswith('PASSWORD_HASHING_'):
+        with _lock:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = None
@@ -0,0 +1,50 @@
+"""
+Local verification of our access tokens for other services.
+
+Depends only on PyJWT with the "crypto" extra, not on Django, so other
+services can import or copy this module:
+
+    verifier = TokenVerifier('https://auth.example.com/.well-known/jwks.json')
+    claims = verifier.verify(token)  # raises jwt.InvalidTokenError
+    user_id = claims['user_id']
+
+Keys are fetched once and cached for ``cache_seconds``. A token with an
+unknown "kid" (after a key rotation) triggers one refetch, so no request
+goes to the auth service otherwise.
+"""
+import jwt
+
+
+class TokenVerifier:
+    """Without ``audience`` the "aud" claim is not checked; pass it for tokens issued to several clients."""
+
+    def __init__(self, jwks_url, audience=None, issuer=None, algorithms=('RS256', 'EdDSA'), token_type='access',
+                 leeway=0, cache_seconds=3600, timeout=5):
+        self.client = jwt.PyJWKClient(jwks_url, cache_jwk_set=True, lifespan=cache_seconds, timeout=timeout)
+        self.audience = audience
+        self.issuer = issuer
+        self.algorithms = algorithms
+        self.token_type = token_type
+        self.leeway = leeway
+
+    def verify(self, token):
+        """Return the claims of a valid, unexpired token; raise jwt.InvalidTokenError otherwise."""
+        try:
+            key = self.client.get_signing_key_from_jwt(token)
+        except jwt.PyJWKClientError as e:
+            raise jwt.InvalidTokenError(str(e)) from e
+        if key.algorithm_name not in self.algorithms:
+            raise jwt.InvalidAlgorithmError(f'algorithm {key.algorithm_name} is not allowed')
+        claims = jwt.decode(
+            token,
+            key.key,
+            algorithms=[key.algorithm_name],
+            audience=self.audience,
+            issuer=self.issuer,
+            leeway=self.leeway,
+            options={'verify_aud': self.audience is not None},
+        )
+        # Refresh-токен подписан тем же ключом, но для доступа к API не годится
+        if self.token_type and claims.get('token_type') != self.token_type:
+            raise jwt.InvalidTokenError(f'token_type must be {self.token_type!r}')
+        return claims
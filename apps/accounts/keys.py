@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import threading
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError, TokenBackendExpiredToken
+from rest_framework_simplejwt.settings import api_settings
+
+_backend = None
+_lock = threading.Lock()
+
+
+class SigningKey:
+    """One private key of the keyring; ``kid`` is its file name without ".pem"."""
+
+    def __init__(self, kid, private_key):
+        self.kid = kid
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        if isinstance(private_key, rsa.RSAPrivateKey):
+            self.algorithm, jwk = 'RS256', RSAAlgorithm.to_jwk(self.public_key)
+        elif isinstance(private_key, ed25519.Ed25519PrivateKey):
+            self.algorithm, jwk = 'EdDSA', OKPAlgorithm.to_jwk(self.public_key)
+        else:
+            raise ImproperlyConfigured(f'JWT key {kid}: only RSA and Ed25519 keys are supported')
+        self.jwk = {**json.loads(jwk), 'kid': kid, 'alg': self.algorithm, 'use': 'sig'}
+
+
+class Keyring:
+    """
+    Private keys from JWT_KEYS_DIR, one PEM file per key.
+
+    Every key is published in the JWKS and accepted for verification, so
+    tokens signed with a retired key stay valid until they expire. New
+    tokens are signed with JWT_SIGNING_KID, or the last key by file name.
+    """
+
+    def __init__(self, keys, signing_kid=None):
+        if not keys:
+            raise ImproperlyConfigured('JWT_KEYS_DIR contains no *.pem keys')
+        self.keys = {key.kid: key for key in keys}
+        if signing_kid and signing_kid not in self.keys:
+            raise ImproperlyConfigured(f'JWT_SIGNING_KID {signing_kid} is not in JWT_KEYS_DIR')
+        self.signing = self.keys[signing_kid or keys[-1].kid]
+        # JWKS отдаётся часто и не меняется до перезапуска: сериализуем один раз
+        self.jwks = json.dumps({'keys': [key.jwk for key in keys]}, separators=(',', ':')).encode()
+        self.jwks_etag = f'"{hashlib.sha256(self.jwks).hexdigest()[:32]}"'
+
+    @classmethod
+    def from_directory(cls, directory, signing_kid=None):
+        keys = []
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith('.pem'):
+                with open(os.path.join(directory, filename), 'rb') as f:
+                    private_key = serialization.load_pem_private_key(f.read(), password=None)
+                keys.append(SigningKey(filename[:-len('.pem')], private_key))
+        return cls(keys, signing_kid)
+
+
+class KeyringTokenBackend(TokenBackend):
+    """simplejwt TokenBackend that signs with the keyring's current key and verifies by the "kid" header."""
+
+    def __init__(self, keyring):
+        super().__init__(
+            keyring.signing.algorithm,
+            audience=api_settings.AUDIENCE,
+            issuer=api_settings.ISSUER,
+            leeway=api_settings.LEEWAY,
+            json_encoder=api_settings.JSON_ENCODER,
+        )
+        self.keyring = keyring
+
+    def encode(self, payload):
+        payload = payload.copy()
+        if self.audience is not None:
+            payload['aud'] = self.audience
+        if self.issuer is not None:
+            payload['iss'] = self.issuer
+        signing = self.keyring.signing
+        return jwt.encode(payload, signing.private_key, algorithm=signing.algorithm, headers={'kid': signing.kid},
+                          json_encoder=self.json_encoder)
+
+    def decode(self, token, verify=True):
+        try:
+            key = self.keyring.keys.get(jwt.get_unverified_header(token).get('kid'))
+            if key is None:
+                raise TokenBackendError(_('Token is invalid'))
+            return jwt.decode(
+                token,
+                key.public_key,
+                algorithms=[key.algorithm],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.get_leeway(),
+                options={'verify_aud': self.audience is not None, 'verify_signature': verify},
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise TokenBackendExpiredToken(_('Token is expired')) from e
+        except jwt.InvalidTokenError as e:
+            raise TokenBackendError(_('Token is invalid')) from e
+
+
+def get_keyring():
+    """The keyring from JWT_KEYS_DIR, or None when tokens are signed with SIMPLE_JWT's shared secret."""
+    backend = get_token_backend()
+    return backend.keyring if isinstance(backend, KeyringTokenBackend) else None
+
+
+def get_token_backend():
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                if settings.JWT_KEYS_DIR:
+                    _backend = KeyringTokenBackend(Keyring.from_directory(settings.JWT_KEYS_DIR,
+                                                                          settings.JWT_SIGNING_KID))
+                else:
+                    from rest_framework_simplejwt.state import token_backend
+                    _backend = token_backend
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_token_backend(setting, **kwargs):
+    global _backend
+    if setting in ('JWT_KEYS_DIR', 'JWT_SIGNING_KID', 'SIMPLE_JWT'):
+        _backend = None
@@ -0,0 +1,118 @@
+import queue
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail.backends.smtp import EmailBackend
+from django.core.mail.message import sanitize_address
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PooledEmailBackend(EmailBackend):
+    """
+    SMTP backend that returns authenticated connections to a process-wide
+    pool on close() instead of sending QUIT.
+
+    Connections idle longer than EMAIL_POOL_IDLE_CHECK are probed with NOOP
+    before reuse and recycled after EMAIL_POOL_MAX_AGE. A message that hits a
+    dropped connection is resent once over a fresh one.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._opened_at = None
+        self._broken = False
+
+    def _get_pool(self):
+        key = (self.host, self.port, self.username, self.use_tls, self.use_ssl)
+        with _pools_lock:
+            if key not in _pools:
+                _pools[key] = queue.LifoQueue(maxsize=settings.EMAIL_POOL_SIZE)
+            return _pools[key]
+
+    def open(self):
+        if self.connection:
+            return False
+        pool = self._get_pool()
+        while True:
+            try:
+                connection, opened_at, released_at = pool.get_nowait()
+            except queue.Empty:
+                break
+            now = time.monotonic()
+            if now - opened_at > settings.EMAIL_POOL_MAX_AGE or (
+                now - released_at > settings.EMAIL_POOL_IDLE_CHECK and not self._is_alive(connection)
+            ):
+                self._discard(connection)
+                continue
+            self.connection = connection
+            self._opened_at = opened_at
+            return True
+        opened = super().open()
+        if opened:
+            self._opened_at = time.monotonic()
+        return opened
+
+    def close(self):
+        if self.connection is None:
+            return
+        connection, self.connection = self.connection, None
+        if self._broken:
+            # Соединение оборвалось и при повторе: в пул не возвращаем
+            self._broken = False
+            self._discard(connection)
+            return
+        try:
+            self._get_pool().put_nowait((connection, self._opened_at, time.monotonic()))
+        except queue.Full:
+            self.connection = connection
+            super().close()
+
+    def _reconnect(self):
+        self._discard(self.connection)
+        self.connection = None
+        return super().open()
+
+    def _send(self, email_message):
+        if not email_message.recipients():
+            return False
+        encoding = email_message.encoding or settings.DEFAULT_CHARSET
+        from_email = sanitize_address(email_message.from_email, encoding)
+        recipients = [sanitize_address(addr, encoding) for addr in email_message.recipients()]
+        message = email_message.message().as_bytes(linesep='\r\n')
+        for retry in (True, False):
+            try:
+                self.connection.sendmail(from_email, recipients, message)
+                return True
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                if not retry:
+                    self._broken = True
+                    if not self.fail_silently:
+                        raise
+                    return False
+                if not self._reconnect():
+                    return False
+                self._opened_at = time.monotonic()
+            except smtplib.SMTPException:
+                if not self.fail_silently:
+                    raise
+                return False
+
+    @staticmethod
+    def _is_alive(connection):
+        try:
+            return connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def _discard(connection):
+        if connection is None:
+            return
+        try:
+            connection.close()
+        except OSError:
+            pass
@@ -0,0 +1,44 @@
+import contextlib
+import os
+import tempfile
+
+from django.db import connection
+from django.test import override_settings
+
+# Локальные заглушки вместо Redis, SMTP и Twilio; лимиты отправки кодов не мешают нагрузке
+BENCH_SETTINGS = dict(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CODE_SEND_LIMITS={'contact': (10 ** 6, 60), 'ip': (10 ** 6, 3600), 'destination_daily': (10 ** 6, 86400)},
+    CODE_DELIVERY_EAGER=True,
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    SMS_BACKEND='accounts.sms.LocMemSMSBackend',
+    VERIFICATION_CODE_STORE='accounts.codes.ModelCodeStore',
+    TOKEN_STATE_BACKEND='accounts.tokens.DatabaseTokenState',
+    ALLOWED_HOSTS=['*'],
+)
+
+
+@contextlib.contextmanager
+def test_database(**settings):
+    """
+    Create a throwaway test database and apply BENCH_SETTINGS for the duration of a benchmark.
+
+    SQLite's default in-memory test database locks whole tables between threads,
+    so for SQLite a temporary file with a busy timeout is used instead.
+    """
+    settings_dict = connection.settings_dict
+    original_test, original_options = dict(settings_dict['TEST']), dict(settings_dict['OPTIONS'])
+    tmpdir = None
+    if connection.vendor == 'sqlite':
+        tmpdir = tempfile.TemporaryDirectory()
+        settings_dict['TEST']['NAME'] = os.path.join(tmpdir.name, 'bench.sqlite3')
+        settings_dict['OPTIONS'].setdefault('timeout', 30)
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        with override_settings(**{**BENCH_SETTINGS, **settings}):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        settings_dict['TEST'], settings_dict['OPTIONS'] = original_test, original_options
+        if tmpdir is not None:
+            tmpdir.cleanup()
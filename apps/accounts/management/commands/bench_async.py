@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+
+from accounts.management.bench import test_database
+from accounts.models import User
+from accounts.tokens import RefreshToken
+
+
+class PeakThreads:
+    """Samples threading.active_count() while a run is in progress."""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(0.01):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность синхронных (WSGI) и асинхронных (ASGI) эндпоинтов в одном процессе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Число запросов на каждый эндпоинт')
+        parser.add_argument('--threads', type=int, default=8, help='Число потоков WSGI-воркера')
+        parser.add_argument('--concurrency', type=int, default=100, help='Число одновременных ASGI-запросов')
+        parser.add_argument('--sms-latency', type=float, default=0.2, help='Эмулируемая задержка SMS-провайдера, с')
+        parser.add_argument('--sms-concurrency', type=int, default=100, help='Размер пула SMS-бэкенда')
+
+    def handle(self, *args, requests, threads, concurrency, sms_latency, sms_concurrency, **options):
+        # Запросы пишут в базу, поэтому гоняем их на отдельной тестовой БД
+        with test_database(SMS_FAKE_LATENCY=sms_latency, SMS_MAX_CONCURRENCY=sms_concurrency):
+            self.run(requests, threads, concurrency)
+
+    def run(self, requests, threads, concurrency):
+        user = User.objects.create_user(email='bench@example.com', password='Sup3r-secret!')
+        user.is_active = True
+        user.save()
+        auth = f'Bearer {RefreshToken.for_user(user).access_token}'
+
+        endpoints = (
+            ('send-code', 'post', lambda i: {'phone': f'+7900{i:07d}'}, {}),
+            ('profile', 'get', lambda i: None, {'headers': {'Authorization': auth}}),
+        )
+        for name, method, payload, extra in endpoints:
+            # Test Client хранит состояние запроса, поэтому у каждого потока свой
+            local = threading.local()
+
+            def call_sync(i):
+                if not hasattr(local, 'client'):
+                    local.client = Client()
+                response = getattr(local.client, method)(f'/api/{name}/', payload(i), content_type='application/json', **extra)
+                assert response.status_code == 200, response.content
+
+            with PeakThreads() as peak:
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=threads) as pool:
+                    list(pool.map(call_sync, range(requests)))
+                elapsed = time.perf_counter() - started
+            self.report(name, 'wsgi', requests, elapsed, peak.peak, f'{threads} threads')
+
+            async def run_async(offset):
+                client = AsyncClient()
+                slots = asyncio.Semaphore(concurrency)
+
+                async def call(i):
+                    # Как и ASGIHandler, даём каждому запросу свой контекст для sync_to_async
+                    async with slots, ThreadSensitiveContext():
+                        response = await getattr(client, method)(
+                            f'/api/async/{name}/', payload(offset + i), content_type='application/json', **extra
+                        )
+                    assert response.status_code == 200, response.content
+
+                await asyncio.gather(*(call(i) for i in range(requests)))
+
+            with PeakThreads() as peak:
+                started = time.perf_counter()
+                asyncio.run(run_async(requests))
+                elapsed = time.perf_counter() - started
+            self.report(name, 'asgi', requests, elapsed, peak.peak, f'{concurrency} in flight')
+
+    def report(self, name, mode, requests, elapsed, peak, detail):
+        self.stdout.write(
+            f'{name:>10} {mode}: {requests / elapsed:7.1f} req/s, '
+            f'{elapsed / requests * 1000:6.1f} ms/req avg, peak threads {peak} ({detail})'
+        )
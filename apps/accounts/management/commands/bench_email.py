@@ -0,0 +1,52 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.mail import EmailMessage
+from django.core.mail.backends.smtp import EmailBackend
+from django.core.management.base import BaseCommand
+
+from accounts.mail import PooledEmailBackend
+from accounts.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает отправку писем через обычный SMTP-бэкенд и пул соединений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--host', help='Внешний SMTP-сервер; по умолчанию поднимается локальный sink')
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--connect-latency', type=float, default=0.05)
+
+    def handle(self, *args, count, threads, host, port, connect_latency, **options):
+        sink = None
+        if host is None:
+            host = '127.0.0.1'
+            sink = SMTPSink(host, 0, connect_latency)
+            port = sink.server_address[1]
+            sink.start()
+        params = dict(host=host, port=port, username='bench', password='bench', use_tls=False, use_ssl=False)
+
+        for name, backend_class in (('smtp', EmailBackend), ('pooled', PooledEmailBackend)):
+            def send(i):
+                EmailMessage(
+                    subject='Ваш код подтверждения',
+                    body=f'Ваш код подтверждения {i:06d}',
+                    from_email='bench@localhost',
+                    to=[f'user{i}@localhost'],
+                    connection=backend_class(**params),
+                ).send()
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(send, range(count)))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{name:>7}: {count} messages in {elapsed:.2f}s, '
+                f'{count / elapsed:.1f} msg/s, {elapsed / count * 1000:.1f} ms/msg'
+            )
+
+        if sink is not None:
+            sink.shutdown()
+            sink.server_close()
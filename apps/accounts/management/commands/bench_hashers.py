@@ -0,0 +1,60 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    BCryptSHA256PasswordHasher,
+    PBKDF2PasswordHasher,
+    get_hasher,
+)
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import hashing
+
+HASHERS = (
+    ('pbkdf2', PBKDF2PasswordHasher),
+    ('argon2', Argon2PasswordHasher),
+    ('bcrypt', BCryptSHA256PasswordHasher),
+)
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает стоимость PBKDF2, Argon2 и bcrypt и пропускную способность пула хеширования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=20, help='Число проверок пароля на каждый алгоритм')
+        parser.add_argument('--concurrency', type=int, default=16, help='Число одновременных запросов к пулу')
+
+    def handle(self, *args, rounds, concurrency, **options):
+        self.stdout.write(f'Default hasher: {get_hasher().algorithm}')
+        for name, hasher_class in HASHERS:
+            hasher = hasher_class()
+            try:
+                encoded = hasher.encode('Sup3r-secret!', hasher.salt())
+            except ValueError as e:
+                # Без библиотеки сравнение теряет смысл: argon2-cffi и bcrypt есть в requirements.txt
+                raise CommandError(f'{name}: {e}') from e
+            started = time.perf_counter()
+            for _ in range(rounds):
+                hasher.verify('Sup3r-secret!', encoded)
+            per_hash = (time.perf_counter() - started) / rounds
+            self.stdout.write(f'{name:>7}: {per_hash * 1000:.1f} ms/verify, params {hasher.safe_summary(encoded)}')
+
+        # Пропускная способность проверок по умолчанию: в потоке запроса и через пул
+        encoded = get_hasher().encode('Sup3r-secret!', get_hasher().salt())
+        total = rounds * 4
+        started = time.perf_counter()
+        for _ in range(total):
+            get_hasher().verify('Sup3r-secret!', encoded)
+        serial = total / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as requests:
+            list(requests.map(lambda _: hashing.check_password('Sup3r-secret!', encoded), range(total)))
+        pooled = total / (time.perf_counter() - started)
+        self.stdout.write(
+            f'inline: {serial:.1f} verify/s; '
+            f'{settings.PASSWORD_HASHING_EXECUTOR} pool x{settings.PASSWORD_HASHING_WORKERS}: {pooled:.1f} verify/s '
+            f'({concurrency} concurrent callers)'
+        )
@@ -0,0 +1,63 @@
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Нагружает запущенный сервер GET-запросами по keep-alive соединениям и выводит пропускную способность'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Например, http://127.0.0.1:8000/api/profile/')
+        parser.add_argument('--clients', type=int, default=32, help='Число одновременных соединений')
+        parser.add_argument('--duration', type=float, default=10, help='Длительность замера, с')
+        parser.add_argument('--header', action='append', default=[], help='Заголовок вида "Name: value"')
+
+    def handle(self, *args, url, clients, duration, header, **options):
+        parts = urlsplit(url)
+        path = parts.path + (f'?{parts.query}' if parts.query else '')
+        headers = dict(h.split(': ', 1) for h in header)
+        latencies = []
+        errors = []
+        deadline = time.perf_counter() + duration
+
+        def client():
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            local = []
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status >= 400:
+                        errors.append(response.status)
+                    if response.getheader('Connection', '').lower() == 'close':
+                        connection.close()
+                except (OSError, http.client.HTTPException) as e:
+                    errors.append(type(e).__name__)
+                    connection.close()
+                    continue
+                local.append(time.perf_counter() - started)
+            connection.close()
+            latencies.extend(local)
+
+        threads = [threading.Thread(target=client) for _ in range(clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if not latencies:
+            self.stderr.write(f'No successful requests, errors: {errors[:5]}')
+            return
+        centiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f'{len(latencies)} requests in {elapsed:.1f}s: {len(latencies) / elapsed:.1f} req/s, '
+            f'p50 {centiles[49] * 1000:.1f} ms, p99 {centiles[98] * 1000:.1f} ms, errors {len(errors)}'
+        )
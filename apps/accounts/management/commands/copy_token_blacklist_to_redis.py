@@ -0,0 +1,43 @@
+import math
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from accounts import keys
+from accounts.tokens import RedisTokenState
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит отозванные и ещё не истекшие refresh-токены из token_blacklist в Redis. '
+        'Запускать при переходе на RedisTokenState: до и сразу после переключения, '
+        'чтобы захватить токены, отозванные в промежутке'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', default='default', help='Кэш django_redis, как у RedisTokenState')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, alias, batch_size, **options):
+        state = RedisTokenState(alias)
+        leeway = keys.get_token_backend().get_leeway().total_seconds()
+        rows = (
+            BlacklistedToken.objects
+            .filter(token__expires_at__gt=timezone.now())
+            .values_list('token__jti', 'token__expires_at')
+            .order_by('pk')
+        )
+        copied = 0
+        pipeline = state.client.pipeline(transaction=False)
+        for jti, expires_at in rows.iterator(chunk_size=batch_size):
+            ttl = math.ceil(expires_at.timestamp() + leeway - timezone.now().timestamp())
+            if ttl <= 0:
+                continue
+            # nx: не затираем отметку 'rotated', уже поставленную самим RedisTokenState
+            pipeline.set(state.jti_key(jti), 'revoked', ex=ttl, nx=True)
+            copied += 1
+            if copied % batch_size == 0:
+                pipeline.execute()
+        pipeline.execute()
+        self.stdout.write(f'Copied {copied} blacklisted tokens to Redis')
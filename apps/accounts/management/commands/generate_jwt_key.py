@@ -0,0 +1,40 @@
+import os
+import secrets
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт закрытый ключ для подписи JWT в JWT_KEYS_DIR. Ротация: создать ключ, задать JWT_SIGNING_KID '
+        'старого ключа и перезапустить (новый попадёт в JWKS), через JWKS_MAX_AGE убрать JWT_SIGNING_KID, '
+        'а старый ключ удалить после истечения выданных им refresh-токенов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algorithm', choices=['RS256', 'EdDSA'], default='RS256')
+        parser.add_argument('--bits', type=int, default=3072, help='Размер ключа RSA')
+        parser.add_argument('--dir', default=settings.JWT_KEYS_DIR, help='По умолчанию JWT_KEYS_DIR')
+
+    def handle(self, *args, algorithm, bits, dir, **options):
+        if not dir:
+            raise CommandError('Укажите --dir или JWT_KEYS_DIR')
+        os.makedirs(dir, mode=0o700, exist_ok=True)
+        if algorithm == 'RS256':
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=bits)
+        else:
+            private_key = ed25519.Ed25519PrivateKey.generate()
+        pem = private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+        )
+        # Имя начинается с даты, поэтому новый ключ оказывается последним при сортировке
+        kid = f'{timezone.now():%Y%m%d%H%M%S}-{secrets.token_hex(4)}'
+        path = os.path.join(dir, f'{kid}.pem')
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pem)
+        self.stdout.write(f'{algorithm} key {kid} written to {path}')
@@ -0,0 +1,216 @@
+import csv
+import io
+import json
+import sys
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import JSONField
+
+from accounts import hashing
+from accounts.models import User
+
+IMPORT_FIELDS = ('email', 'phone', 'first_name', 'last_name', 'company_name', 'status', 'gender', 'birth_day',
+                 'is_active')
+# В файл отклонённых строк пароли не попадают
+SECRET_FIELDS = ('password', 'password_hash')
+
+
+def read_rows(stream, format):
+    """Yield (line number, row) pairs; row is None for a line that is not a JSON object."""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+def copy_value(field, user):
+    value = field.pre_save(user, add=True)
+    if value is None:
+        return r'\N'
+    if isinstance(field, JSONField):
+        return json.dumps(value)
+    return field.get_db_prep_save(value, connection)
+
+
+def copy_users(users):
+    """Load users with a single COPY ... FROM STDIN (PostgreSQL only)."""
+    fields = [field for field in User._meta.concrete_fields if not field.primary_key]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for user in users:
+        writer.writerow([copy_value(field, user) for field in fields])
+    buffer.seek(0)
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {quote(User._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer,
+        )
+
+
+class Command(BaseCommand):
+    help = 'Массовый импорт пользователей из CSV или JSONL: пароли хешируются в пуле процессов, строки вставляются пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV или JSONL файл; "-" читает stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='По умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=settings.PASSWORD_HASHING_WORKERS,
+                            help='Число процессов для хеширования паролей')
+        parser.add_argument('--rejects', help='Записать отклонённые строки с причинами в JSONL-файл')
+        parser.add_argument('--copy', action='store_true', help='Загружать пачки через COPY (только PostgreSQL)')
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить файл, ничего не записывая')
+
+    def handle(self, *args, path, format, batch_size, workers, rejects, copy, dry_run, **options):
+        if copy and connection.vendor != 'postgresql':
+            raise CommandError('--copy работает только с PostgreSQL')
+        format = format or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        self.phone_field = User._meta.get_field('phone')
+        self.seen_emails, self.seen_phones = set(), set()
+        self.rejects = open(rejects, 'w', encoding='utf-8') if rejects else None
+        self.rejected = 0
+        imported = 0
+        started = time.monotonic()
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            with stream, hashing.bulk_executor(workers) as pool:
+                rows = read_rows(stream, format)
+                while batch := list(islice(rows, batch_size)):
+                    prepared = self.prepare(batch)
+                    if not dry_run:
+                        self.hash_passwords(prepared, pool, workers)
+                        imported += self.insert(prepared, copy)
+                    else:
+                        imported += len(prepared)
+                    if options['verbosity'] > 0:
+                        rate = (imported + self.rejected) / (time.monotonic() - started)
+                        self.stderr.write(f'{imported} imported, {self.rejected} rejected ({rate:.0f} rows/s)')
+        finally:
+            if self.rejects is not None:
+                self.rejects.close()
+
+        verb = 'Validated' if dry_run else 'Imported'
+        self.stdout.write(f'{verb} {imported} users, rejected {self.rejected} in {time.monotonic() - started:.1f}s')
+
+    def reject(self, line, row, errors):
+        self.rejected += 1
+        if self.rejects is not None:
+            row = {key: value for key, value in (row or {}).items() if key not in SECRET_FIELDS}
+            self.rejects.write(json.dumps({'line': line, 'row': row, 'errors': errors}, ensure_ascii=False) + '\n')
+
+    def clean(self, row):
+        values, errors = {}, []
+        for name in IMPORT_FIELDS:
+            raw = row.get(name)
+            if raw is None or raw == '':
+                continue
+            try:
+                values[name] = User._meta.get_field(name).clean(str(raw), None)
+            except ValidationError as e:
+                errors.append(f'{name}: {" ".join(e.messages)}')
+        if values.get('email'):
+            values['email'] = User.objects.normalize_email(values['email'])
+        if 'phone' in values:
+            values['phone'] = self.phone_field.get_prep_value(values['phone'])
+        # То же условие, что и в ограничении at_least_one_contact
+        if not values.get('email') and not values.get('phone') and not any(
+            error.startswith(('email', 'phone')) for error in errors
+        ):
+            errors.append('Укажите телефон или почту')
+
+        password, password_hash = row.get('password') or None, row.get('password_hash') or None
+        if password and password_hash:
+            errors.append('Укажите либо password, либо password_hash')
+        elif password_hash and hashers.is_password_usable(password_hash):
+            try:
+                hashers.identify_hasher(password_hash)
+            except ValueError:
+                errors.append('password_hash: неизвестный алгоритм хеширования')
+        return values, str(password) if password else None, password_hash, errors
+
+    def prepare(self, batch):
+        """Validate a batch; returns (line, row, user, raw password) for the rows that can be inserted."""
+        candidates = []
+        for line, row in batch:
+            if row is None:
+                self.reject(line, None, ['Строка не является JSON-объектом'])
+                continue
+            values, password, password_hash, errors = self.clean(row)
+            email, phone = values.get('email'), values.get('phone')
+            if email and email in self.seen_emails:
+                errors.append('email: уже встречался в файле')
+            if phone and phone in self.seen_phones:
+                errors.append('phone: уже встречался в файле')
+            if errors:
+                self.reject(line, row, errors)
+                continue
+            self.seen_emails.add(email)
+            self.seen_phones.add(phone)
+            user = User(**values)
+            user.password = password_hash or (None if password else hashers.make_password(None))
+            candidates.append((line, row, user, password))
+
+        # Занятые почты и телефоны одним запросом на пачку
+        emails = [user.email for _, _, user, _ in candidates if user.email]
+        phones = [user.phone for _, _, user, _ in candidates if user.phone]
+        taken_emails = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+        taken_phones = {self.phone_field.get_prep_value(phone)
+                        for phone in User.objects.filter(phone__in=phones).values_list('phone', flat=True)}
+        prepared = []
+        for line, row, user, password in candidates:
+            errors = []
+            if user.email in taken_emails:
+                errors.append('email: пользователь с такой почтой уже есть')
+            if user.phone in taken_phones:
+                errors.append('phone: пользователь с таким телефоном уже есть')
+            if errors:
+                self.reject(line, row, errors)
+            else:
+                prepared.append((line, row, user, password))
+        return prepared
+
+    @staticmethod
+    def hash_passwords(prepared, pool, workers):
+        pending = [(user, password) for _, _, user, password in prepared if password]
+        chunksize = max(1, len(pending) // (workers * 4))
+        hashed = pool.map(hashers.make_password, [password for _, password in pending], chunksize=chunksize)
+        for (user, _), encoded in zip(pending, hashed):
+            user.password = encoded
+
+    def insert(self, prepared, copy):
+        users = [user for _, _, user, _ in prepared]
+        try:
+            with transaction.atomic():
+                if copy:
+                    copy_users(users)
+                else:
+                    User.objects.bulk_create(users)
+            return len(users)
+        except IntegrityError:
+            pass
+        # Почту или телефон успели занять после проверки: вставляем по одной, чтобы отсеять только конфликтные
+        inserted = 0
+        for line, row, user, _ in prepared:
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create([user])
+                inserted += 1
+            except IntegrityError as e:
+                self.reject(line, row, [str(e)])
+        return inserted
@@ -0,0 +1,173 @@
+import json
+import re
+import statistics
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core import mail
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from accounts import sms
+from accounts.management.bench import test_database
+
+PASSWORD = 'Sup3r-secret!'
+NEW_PASSWORD = 'N3w-secret!!'
+
+
+class Recorder:
+    """Collects latencies per endpoint from all virtual users."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name, elapsed, ok):
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            if not ok:
+                self.errors[name] += 1
+
+
+class VirtualUser:
+    """One client going through the whole account lifecycle against the in-process API."""
+
+    def __init__(self, recorder, index):
+        self.recorder = recorder
+        self.client = Client()
+        self.email = f'load-{index}-{uuid.uuid4().hex[:8]}@example.com'
+        self.phone = f'+7999{index:07d}'
+
+    def call(self, name, method, path, data=None, expected=200, token=None):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        started = time.perf_counter()
+        response = getattr(self.client, method)(path, data, content_type='application/json', **headers)
+        elapsed = time.perf_counter() - started
+        ok = response.status_code == expected
+        self.recorder.record(name, elapsed, ok)
+        if not ok:
+            raise AssertionError(f'{name}: {response.status_code} {response.content[:200]!r}')
+        return response.json() if response.content else None
+
+    def code_for(self, **contact):
+        self.call('send-code', 'post', '/api/send-code/', contact)
+        destination = contact.get('email') or contact.get('phone')
+        # Доставка в режиме CODE_DELIVERY_EAGER уже прошла, код лежит в outbox заглушки
+        if 'email' in contact:
+            bodies = [message.body for message in reversed(mail.outbox) if destination in message.to]
+        else:
+            bodies = [body for to, body in reversed(sms.outbox) if to == destination]
+        return re.search(r'\d{6}', bodies[0]).group()
+
+    def run(self):
+        code = self.code_for(email=self.email)
+        self.call('register', 'post', '/api/register/', {
+            'email': self.email, 'password': PASSWORD, 'code': code, 'status': 'APPLICANT',
+        }, expected=201)
+
+        tokens = self.call('login/password', 'post', '/api/login/password/', {
+            'email': self.email, 'password': PASSWORD,
+        })['tokens']
+
+        self.call('profile', 'get', '/api/profile/', token=tokens['access'])
+        self.call('profile/update', 'patch', '/api/profile/', {'phone': self.phone}, token=tokens['access'])
+
+        code = self.code_for(phone=self.phone)
+        tokens = self.call('login/code', 'post', '/api/login/code/', {'phone': self.phone, 'code': code})['tokens']
+
+        tokens = self.call('token/refresh', 'post', '/api/token/refresh/', {'refresh': tokens['refresh']})
+
+        code = self.code_for(email=self.email)
+        self.call('password-reset', 'post', '/api/password-reset/', {
+            'email': self.email, 'code': code, 'new_password': NEW_PASSWORD,
+        })
+
+        self.call('logout', 'post', '/api/logout/', {'refresh': tokens['refresh']}, expected=205,
+                  token=tokens['access'])
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест API аккаунтов на локальных заглушках: пропускная способность и p50/p95/p99 по эндпоинтам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Число виртуальных пользователей (полных сценариев)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Число одновременно работающих пользователей')
+        parser.add_argument('--save', help='Сохранить результаты в JSON-файл')
+        parser.add_argument('--baseline', help='JSON-файл с прошлым прогоном для сравнения p95')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Допустимый рост p95 относительно --baseline (0.25 = 25%%)')
+        parser.add_argument('--fast-hashing', action='store_true',
+                            help='MD5 вместо настоящих хешеров, чтобы хеширование не заслоняло остальное')
+
+    def handle(self, *args, users, concurrency, save, baseline, tolerance, fast_hashing, **options):
+        recorder = Recorder()
+        failures = []
+        settings = {'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher']} if fast_hashing else {}
+        with test_database(**settings):
+            mail.outbox = []
+            del sms.outbox[:]
+
+            def run_user(index):
+                try:
+                    VirtualUser(recorder, index).run()
+                except AssertionError as e:
+                    failures.append(str(e))
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(run_user, range(users)))
+            elapsed = time.perf_counter() - started
+
+        results = self.summarize(recorder, elapsed)
+        self.report(results, users, concurrency, elapsed)
+        for failure in failures[:5]:
+            self.stderr.write(failure)
+
+        if save:
+            with open(save, 'w') as f:
+                json.dump(results, f, indent=2)
+        if baseline:
+            self.compare(results, baseline, tolerance)
+        if failures:
+            raise CommandError(f'{len(failures)} of {users} scenarios failed')
+
+    @staticmethod
+    def summarize(recorder, elapsed):
+        results = {}
+        for name, latencies in sorted(recorder.latencies.items()):
+            centiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+            results[name] = {
+                'requests': len(latencies),
+                'errors': recorder.errors[name],
+                'rps': len(latencies) / elapsed,
+                'p50_ms': centiles[49] * 1000,
+                'p95_ms': centiles[94] * 1000,
+                'p99_ms': centiles[98] * 1000,
+            }
+        return results
+
+    def report(self, results, users, concurrency, elapsed):
+        total = sum(row['requests'] for row in results.values())
+        self.stdout.write(f'{users} users, concurrency {concurrency}: {total} requests in {elapsed:.1f}s '
+                          f'({total / elapsed:.1f} req/s)')
+        self.stdout.write(f'{"endpoint":<16}{"requests":>9}{"errors":>7}{"req/s":>8}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}')
+        for name, row in results.items():
+            self.stdout.write(
+                f'{name:<16}{row["requests"]:>9}{row["errors"]:>7}{row["rps"]:>8.1f}'
+                f'{row["p50_ms"]:>9.1f}{row["p95_ms"]:>9.1f}{row["p99_ms"]:>9.1f}'
+            )
+
+    def compare(self, results, baseline, tolerance):
+        with open(baseline) as f:
+            previous = json.load(f)
+        regressions = []
+        for name, row in results.items():
+            if name in previous and row['p95_ms'] > previous[name]['p95_ms'] * (1 + tolerance):
+                regressions.append(f'{name}: p95 {previous[name]["p95_ms"]:.1f} -> {row["p95_ms"]:.1f} ms')
+        if regressions:
+            raise CommandError('p95 regression:\n' + '\n'.join(regressions))
+        self.stdout.write(f'No p95 regressions against {baseline} (tolerance {tolerance:.0%})')
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts import avatars
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии аватаров, которые не успела обработать фоновая очередь (например, при рестарте)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Обработать не больше N пользователей')
+
+    def handle(self, *args, limit, **options):
+        queryset = User.objects.filter(avatar_variants={}).exclude(avatar__in=['', avatars.DEFAULT_AVATAR])
+        queryset = queryset.order_by('pk').values_list('pk', 'avatar')
+        started = time.monotonic()
+        processed = failed = 0
+        for user_id, name in queryset[:limit].iterator():
+            if avatars.process_avatar(user_id, name, previous=name) is None:
+                failed += 1
+            else:
+                processed += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{user_id}: {name}')
+        self.stdout.write(f'Processed {processed} avatars, rejected {failed} in {time.monotonic() - started:.1f}s')
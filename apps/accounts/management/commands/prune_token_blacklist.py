@@ -0,0 +1,78 @@
+import json
+import os
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from accounts.utils import delete_in_batches
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет истекшие OutstandingToken и связанные BlacklistedToken пачками, '
+        'при необходимости архивируя их в JSONL'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=0,
+                            help='Сколько часов хранить токены после истечения')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--pause', type=float, default=0.1, help='Пауза между пачками в секундах')
+        parser.add_argument('--archive', help='Дописывать удаляемые строки в этот JSONL-файл')
+
+    def handle(self, *args, grace_hours, batch_size, pause, archive, **options):
+        queryset = OutstandingToken.objects.filter(expires_at__lt=timezone.now() - timedelta(hours=grace_hours))
+        before_delete = None
+        if archive:
+            before_delete = Archiver(archive)
+            if before_delete.last_pk:
+                self.stdout.write(f'Resuming: rows up to id {before_delete.last_pk} are already archived')
+
+        started = time.monotonic()
+        total = 0
+        try:
+            for deleted in delete_in_batches(queryset, batch_size, pause, before_delete):
+                total += deleted
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'Deleted {total} tokens, {total / (time.monotonic() - started):.0f} rows/s')
+        finally:
+            if before_delete is not None:
+                before_delete.close()
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'Done: {total} tokens in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} rows/s)')
+
+
+class Archiver:
+    """
+    Appends batches to a JSONL file and records the last archived id in
+    ``<file>.checkpoint`` once the batch is on disk, so an interrupted run
+    does not archive the same rows twice.
+    """
+
+    fields = ('id', 'jti', 'user_id', 'created_at', 'expires_at', 'blacklistedtoken__blacklisted_at')
+
+    def __init__(self, path):
+        self.checkpoint = f'{path}.checkpoint'
+        self.last_pk = 0
+        if os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as f:
+                self.last_pk = int(f.read().strip() or 0)
+        self.file = open(path, 'a')
+
+    def __call__(self, pks):
+        rows = OutstandingToken.objects.filter(pk__in=pks, pk__gt=self.last_pk).order_by('pk').values(*self.fields)
+        for row in rows.iterator():
+            row['blacklisted_at'] = row.pop('blacklistedtoken__blacklisted_at')
+            self.file.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_pk = max(self.last_pk, pks[-1])
+        with open(self.checkpoint, 'w') as f:
+            f.write(str(self.last_pk))
+
+    def close(self):
+        self.file.close()
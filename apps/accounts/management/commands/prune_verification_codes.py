@@ -0,0 +1,28 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts.models import VerificationCode
+from accounts.utils import delete_in_batches
+
+
+class Command(BaseCommand):
+    help = 'Удаляет истекшие и использованные коды подтверждения пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-hours', type=float, default=settings.VERIFICATION_CODE_RETENTION_HOURS,
+                            help='Сколько часов хранить коды после истечения')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.1, help='Пауза между пачками в секундах')
+
+    def handle(self, *args, retention_hours, batch_size, pause, **options):
+        queryset = VerificationCode.objects.stale(timedelta(hours=retention_hours))
+        started = time.monotonic()
+        total = 0
+        for deleted in delete_in_batches(queryset, batch_size, pause):
+            total += deleted
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Deleted {total} codes')
+        self.stdout.write(f'Deleted {total} verification codes in {time.monotonic() - started:.1f}s')
@@ -0,0 +1,58 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from accounts import avatars
+from accounts.delivery import claim_jobs, process_jobs
+
+
+class Command(BaseCommand):
+    help = 'Отправляет коды подтверждения из очереди доставки и доделывает брошенную обработку аватаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.DELIVERY_WORKERS)
+        parser.add_argument('--batch-size', type=int, default=settings.DELIVERY_BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true', help='Обработать очередь один раз и выйти')
+
+    def handle(self, *args, threads, batch_size, poll_interval, once, **options):
+        self._stopping = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self._stop)
+            signal.signal(signal.SIGINT, self._stop)
+        self.stdout.write(f'Delivery worker started with {threads} threads')
+
+        workers = [
+            threading.Thread(target=self._loop, args=(batch_size, poll_interval, once), name=f'delivery-{i}')
+            for i in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.stdout.write('Delivery worker stopped')
+
+    def _loop(self, batch_size, poll_interval, once):
+        try:
+            while not self._stopping.is_set():
+                close_old_connections()
+                jobs = claim_jobs(limit=batch_size)
+                if jobs:
+                    process_jobs(jobs)
+                # Аватары, которые не обработал перезапущенный веб-воркер
+                avatar_jobs = avatars.claim_jobs(limit=batch_size)
+                for job in avatar_jobs:
+                    avatars.run_job(job)
+                if jobs or avatar_jobs:
+                    continue
+                if once:
+                    break
+                self._stopping.wait(poll_interval)
+        finally:
+            connection.close()
+
+    def _stop(self, signum, frame):
+        self._stopping.set()
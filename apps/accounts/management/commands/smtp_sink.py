@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from accounts.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = 'Локальный SMTP-сервер, принимающий и отбрасывающий письма (для бенчмарков)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--connect-latency', type=float, default=0.0,
+                            help='Задержка в секундах на приветствие и на AUTH')
+
+    def handle(self, *args, host, port, connect_latency, **options):
+        server = SMTPSink(host, port, connect_latency)
+        self.stdout.write(f'SMTP sink listening on {host}:{port}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Received {server.received} messages')
@@ -0,0 +1,324 @@
+import contextvars
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+# Время, накопленное текущим запросом по фазам; None вне запроса
+_request = contextvars.ContextVar('metrics_request', default=None)
+# Открытая сейчас фаза: вложенная фаза вычитает своё время из внешней, чтобы оно не считалось дважды
+_current_phase = contextvars.ContextVar('metrics_phase', default=None)
+_disabled = nullcontext()
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram with a fixed label set, safe to observe from any thread."""
+
+    def __init__(self, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Счётчики по корзинам плюс +Inf, затем сумма
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def series(self):
+        with self._lock:
+            return {labels: list(values) for labels, values in self._series.items()}
+
+    def expose(self, series=None):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        if series is None:
+            series = self.series()
+        for labels, values in sorted(series.items()):
+            pairs = [f'{name}="{escape(value)}"' for name, value in zip(self.labelnames, labels)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                le = ','.join(pairs + [f'le="{bound}"'])
+                lines.append(f'{self.name}_bucket{{{le}}} {cumulative}')
+            label_str = '{' + ','.join(pairs) + '}' if pairs else ''
+            lines.append(f'{self.name}_sum{label_str} {values[-1]}')
+            lines.append(f'{self.name}_count{label_str} {cumulative}')
+        return lines
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram(
+    'auth_request_duration_seconds', 'Request duration by route.', ('route', 'method', 'status'),
+)
+PHASE_SECONDS = Histogram(
+    'auth_request_phase_seconds', 'Time a request spent in db, cache, hashing, jwt, email and sms.', ('route', 'phase'),
+)
+DB_QUERIES = Histogram(
+    'auth_request_db_queries', 'Database queries per request.', ('route',), buckets=COUNT_BUCKETS,
+)
+HISTOGRAMS = (REQUEST_SECONDS, PHASE_SECONDS, DB_QUERIES)
+
+
+class _Phase:
+    __slots__ = ('name', 'queries', 'started', 'nested', 'token')
+
+    def __init__(self, name, queries=0):
+        self.name = name
+        self.queries = queries
+
+    def __enter__(self):
+        self.nested = 0.0
+        self.token = _current_phase.set(self)
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        _current_phase.reset(self.token)
+        parent = _current_phase.get()
+        if parent is not None:
+            parent.nested += elapsed
+        record(self.name, elapsed - self.nested, self.queries)
+
+
+def phase(name):
+    """
+    Context manager that attributes the time spent inside it to ``name``,
+    minus the time of phases nested in it.
+
+    Inside a request the time is added to the request's totals; outside
+    one (delivery worker, management commands) it is observed on its own
+    under route="background".
+    """
+    if not settings.METRICS_ENABLED:
+        return _disabled
+    return _Phase(name)
+
+
+def record(name, elapsed, queries=0):
+    totals = _request.get()
+    if totals is None:
+        PHASE_SECONDS.observe(elapsed, 'background', name)
+        return
+    totals[name] = totals.get(name, 0.0) + elapsed
+    if queries:
+        totals['queries'] += queries
+
+
+def db_wrapper(execute, sql, params, many, context):
+    with _Phase('db', queries=1):
+        return execute(sql, params, many, context)
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """connection_created receiver: time every query on every connection of every thread."""
+    if db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_wrapper)
+
+
+class MetricsMiddleware:
+    """Collects per-route request timings; removed from the stack unless METRICS_ENABLED."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        totals, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        self._finish(request, response, totals, started)
+        return response
+
+    async def __acall__(self, request):
+        totals, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request.reset(token)
+        self._finish(request, response, totals, started)
+        return response
+
+    @staticmethod
+    def _start():
+        totals = {'queries': 0}
+        return totals, _request.set(totals), time.perf_counter()
+
+    @staticmethod
+    def _finish(request, response, totals, started):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        REQUEST_SECONDS.observe(elapsed, route, request.method, str(response.status_code))
+        DB_QUERIES.observe(totals.pop('queries'), route)
+        for name, seconds in totals.items():
+            PHASE_SECONDS.observe(seconds, route, name)
+        flush()
+
+
+def gauges():
+    """
+    Point-in-time values read at scrape time. They describe the process that
+    answers the scrape, so with METRICS_DIR every series carries its pid.
+    """
+    from accounts import hashing
+    from uasz_portal.db.postgresql_pool.base import pool_stats
+
+    pid = f',pid="{os.getpid()}"' if settings.METRICS_DIR else ''
+    lines = ['# TYPE auth_hashing_tasks gauge']
+    stats = hashing.stats()
+    lines += [f'auth_hashing_tasks{{state="{state}"{pid}}} {stats[state]}' for state in ('waiting', 'running')]
+    pools = pool_stats()
+    if pools:
+        lines.append('# TYPE auth_db_pool_connections gauge')
+        for alias, stats in pools.items():
+            for state in ('in_use', 'idle', 'waiting', 'max_size'):
+                lines.append(f'auth_db_pool_connections{{alias="{escape(alias)}",state="{state}"{pid}}} {stats[state]}')
+        lines.append('# TYPE auth_db_pool_events_total counter')
+        for alias, stats in pools.items():
+            for event in ('checkouts', 'created', 'discarded', 'timeouts'):
+                lines.append(f'auth_db_pool_events_total{{alias="{escape(alias)}",event="{event}"{pid}}} {stats[event]}')
+    return lines
+
+
+# Гистограммы живут в памяти процесса. С METRICS_DIR каждый процесс сбрасывает их в свой файл,
+# а /metrics складывает все файлы, поэтому любой воркер gunicorn отдаёт общие счётчики.
+# Счётчики завершившихся воркеров переносятся в один файл, чтобы суммы не уменьшались
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+_retired = False
+EXITED_FILE = 'metrics-exited.json'
+
+
+def _snapshot_path():
+    return os.path.join(settings.METRICS_DIR, f'metrics-{os.getpid()}.json')
+
+
+def _snapshot():
+    return {histogram.name: histogram.series() for histogram in HISTOGRAMS}
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {name: {tuple(labels): values for labels, values in series} for name, series in data.items()}
+
+
+def _write(path, snapshot):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = {name: [[list(labels), values] for labels, values in series.items()] for name, series in snapshot.items()}
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _merge(total, snapshot):
+    for name, series in snapshot.items():
+        merged = total.setdefault(name, {})
+        for labels, values in series.items():
+            if labels in merged:
+                merged[labels] = [a + b for a, b in zip(merged[labels], values)]
+            else:
+                merged[labels] = list(values)
+    return total
+
+
+def _locked(shared):
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    f = open(os.path.join(settings.METRICS_DIR, 'metrics.lock'), 'a')
+    fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    return f
+
+
+def flush(force=False):
+    """
+    Write this process's histograms to METRICS_DIR, at most once per
+    METRICS_FLUSH_INTERVAL seconds unless ``force`` is set.
+    """
+    global _last_flush
+    if not settings.METRICS_DIR or _retired:
+        return
+    if not force and time.monotonic() - _last_flush < settings.METRICS_FLUSH_INTERVAL:
+        return
+    # Без force файл пишет только один поток, остальные не ждут
+    if not _flush_lock.acquire(blocking=force):
+        return
+    try:
+        if not _retired:
+            _last_flush = time.monotonic()
+            _write(_snapshot_path(), _snapshot())
+    except OSError as e:
+        # Метрики не должны ломать запросы
+        logger.warning('Cannot write metrics to %s: %s', settings.METRICS_DIR, e)
+    finally:
+        _flush_lock.release()
+
+
+def retire():
+    """Fold this process's histograms into the totals of exited processes; gunicorn's worker_exit hook."""
+    global _retired
+    if not settings.METRICS_DIR:
+        return
+    with _flush_lock, _locked(shared=False):
+        _retired = True
+        exited = os.path.join(settings.METRICS_DIR, EXITED_FILE)
+        _write(exited, _merge(_read(exited), _snapshot()))
+        try:
+            os.remove(_snapshot_path())
+        except FileNotFoundError:
+            pass
+
+
+def collect():
+    """Histograms of every process that wrote to METRICS_DIR, summed."""
+    flush(force=True)
+    total = {}
+    with _locked(shared=True):
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, 'metrics-*.json')):
+            _merge(total, _read(path))
+    return total
+
+
+def expose():
+    collected = collect() if settings.METRICS_DIR else {}
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.expose(collected.get(histogram.name, {}) if settings.METRICS_DIR else None)
+    lines += gauges()
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-18 02:19
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_user_gender'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(choices=[('EMAIL', 'email'), ('PHONE', 'phone')], max_length=5, verbose_name='Канал')),
+                ('destination', models.CharField(max_length=100, verbose_name='Телефон/почта')),
+                ('message', models.TextField(blank=True, verbose_name='Сообщение')),
+                ('status', models.CharField(choices=[('PENDING', 'В очереди'), ('SENDING', 'Отправляется'), ('SENT', 'Отправлено'), ('FAILED', 'Ошибка')], default='PENDING', max_length=7, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попытки')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Взято в работу')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время создания')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Время отправки')),
+            ],
+            options={
+                'verbose_name': 'Задача доставки',
+                'verbose_name_plural': 'Задачи доставки',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='deliveryjob',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='delivery_status_next_idx'),
+        ),
+    ]
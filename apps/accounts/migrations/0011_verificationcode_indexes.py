@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-18 02:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_deliveryjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='verificationcode',
+            index=models.Index(fields=['destination', 'code', 'is_used'], name='vcode_lookup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verificationcode',
+            index=models.Index(condition=models.Q(('is_used', False)), fields=['destination', 'code'], name='vcode_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verificationcode',
+            index=models.Index(fields=['expired_at'], name='vcode_expired_at_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_verificationcode_indexes'),
+        ('token_blacklist', '0012_alter_outstandingtoken_user'),
+    ]
+
+    operations = [
+        # Таблица принадлежит simplejwt, поэтому индекс для prune_token_blacklist создаем вручную
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS token_blacklist_outstandingtoken_expires_at_idx '
+                'ON token_blacklist_outstandingtoken (expires_at)',
+            reverse_sql='DROP INDEX IF EXISTS token_blacklist_outstandingtoken_expires_at_idx',
+        ),
+    ]
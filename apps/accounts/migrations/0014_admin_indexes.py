@@ -0,0 +1,51 @@
+# Generated by Django 4.2 on 2026-10-18 02:55
+
+from django.db import migrations, models
+
+# Индексы под поиск админки по началу строки (search_fields '^email', '^phone'): Django ищет через
+# UPPER(col::text) LIKE UPPER('...%'), а обычный btree такой LIKE не использует. Только PostgreSQL.
+SEARCH_INDEXES = (
+    ('user_email_upper_prefix_idx', 'email'),
+    ('user_phone_upper_prefix_idx', 'phone'),
+)
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, column in SEARCH_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON accounts_user (UPPER({column}::text) text_pattern_ops)'
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не блокирует запись в таблицу, но не работает внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0013_user_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['created_at'], name='user_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['status', 'created_at'], name='user_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_active', 'created_at'], name='user_active_created_idx'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
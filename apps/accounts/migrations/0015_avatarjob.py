@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-18 03:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvatarJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Загруженный файл')),
+                ('previous', models.CharField(blank=True, max_length=100, verbose_name='Предыдущий файл')),
+                ('previous_variants', models.JSONField(blank=True, default=dict, verbose_name='Предыдущие варианты')),
+                ('attempts', models.PositiveSmallIntegerField(default=1, verbose_name='Попытки')),
+                ('locked_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Взято в работу')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время создания')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Обработка аватара',
+                'verbose_name_plural': 'Обработка аватаров',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='avatarjob',
+            index=models.Index(fields=['locked_at'], name='avatarjob_locked_at_idx'),
+        ),
+    ]
@@ -6,6 +6,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from phonenumber_field.modelfields import PhoneNumberField
 
+from accounts import hashing
+
 
 class UserAccountManager(BaseUserManager):
     def create_user(self, email=None, phone=None, password=None, **extra_fields):
@@ -17,7 +19,10 @@ class UserAccountManager(BaseUserManager):
             phone=phone,
             **extra_fields
         )
-        user.set_password(password)
+        if password is None:
+            user.set_unusable_password()
+        else:
+            hashing.set_password(user, password)
         user.save(using=self._db)
         return user
 
@@ -80,6 +85,8 @@ class User(AbstractBaseUser, PermissionsMixin):
         validators=[FileExtensionValidator(['png', 'jpg', 'jpeg'])],
         blank=True,
     )
+    # Уменьшенные копии аватара: {'small': {'jpeg': путь, 'webp': путь}, ...}
+    avatar_variants = models.JSONField(default=dict, blank=True, verbose_name=_('Варианты аватара'))
     status = models.CharField(
         choices=STATUS_CHOICES,
         default='APPLICANT',
@@ -101,6 +108,12 @@ class User(AbstractBaseUser, PermissionsMixin):
                 name='at_least_one_contact'
             )
         ]
+        # Фильтры админки вместе с сортировкой по created_at; индексы для поиска см. миграцию 0014
+        indexes = [
+            models.Index(fields=['created_at'], name='user_created_at_idx'),
+            models.Index(fields=['status', 'created_at'], name='user_status_created_idx'),
+            models.Index(fields=['is_active', 'created_at'], name='user_active_created_idx'),
+        ]
 
     def __str__(self):
         return self.email or str(self.phone)
@@ -133,6 +146,12 @@ class User(AbstractBaseUser, PermissionsMixin):
         self.save(update_fields=['phone_verified_at'])
 
 
+class VerificationCodeQuerySet(models.QuerySet):
+    def stale(self, retention):
+        """Codes that expired more than ``retention`` ago, used or not."""
+        return self.filter(expired_at__lt=timezone.now() - retention)
+
+
 class VerificationCode(models.Model):
     TYPE_CHOICES = (
         ('EMAIL', 'email'),
@@ -144,13 +163,85 @@ class VerificationCode(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Время создания'))
     expired_at = models.DateTimeField(verbose_name=_('Время действия'))
     is_used = models.BooleanField(default=False)
+    objects = VerificationCodeQuerySet.as_manager()
 
     class Meta:
         verbose_name = _('Код верификации')
         verbose_name_plural = _('Коды верификации')
+        indexes = [
+            models.Index(fields=['destination', 'code', 'is_used'], name='vcode_lookup_idx'),
+            models.Index(
+                fields=['destination', 'code'],
+                condition=Q(is_used=False),
+                name='vcode_live_idx'
+            ),
+            models.Index(fields=['expired_at'], name='vcode_expired_at_idx'),
+        ]
 
     def __str__(self):
         return f'{self.destination}-{self.code}'
 
     def is_expired(self):
-        return self.expired_at < timezone.now()
\ No newline at end of file
+        return self.expired_at < timezone.now()
+
+
+class DeliveryJobQuerySet(models.QuerySet):
+    def finished(self, retention):
+        """Sent or failed jobs created more than ``retention`` ago."""
+        return self.filter(status__in=['SENT', 'FAILED'], created_at__lt=timezone.now() - retention)
+
+
+class DeliveryJob(models.Model):
+    CHANNEL_CHOICES = (
+        ('EMAIL', 'email'),
+        ('PHONE', 'phone')
+    )
+    STATUS_CHOICES = (
+        ('PENDING', 'В очереди'),
+        ('SENDING', 'Отправляется'),
+        ('SENT', 'Отправлено'),
+        ('FAILED', 'Ошибка'),
+    )
+    channel = models.CharField(choices=CHANNEL_CHOICES, max_length=5, verbose_name=_('Канал'))
+    destination = models.CharField(max_length=100, verbose_name=_('Телефон/почта'))
+    message = models.TextField(blank=True, verbose_name=_('Сообщение'))
+    status = models.CharField(choices=STATUS_CHOICES, default='PENDING', max_length=7, verbose_name=_('Статус'))
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name=_('Попытки'))
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name=_('Следующая попытка'))
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Взято в работу'))
+    last_error = models.TextField(blank=True, verbose_name=_('Последняя ошибка'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Время создания'))
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Время отправки'))
+
+    objects = DeliveryJobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _('Задача доставки')
+        verbose_name_plural = _('Задачи доставки')
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='delivery_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.channel}-{self.destination}-{self.status}'
+
+
+class AvatarJob(models.Model):
+    """Avatar waiting for processing; removed once its variants are stored."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name=_('Пользователь'))
+    name = models.CharField(max_length=100, verbose_name=_('Загруженный файл'))
+    previous = models.CharField(max_length=100, blank=True, verbose_name=_('Предыдущий файл'))
+    previous_variants = models.JSONField(default=dict, blank=True, verbose_name=_('Предыдущие варианты'))
+    attempts = models.PositiveSmallIntegerField(default=1, verbose_name=_('Попытки'))
+    locked_at = models.DateTimeField(default=timezone.now, verbose_name=_('Взято в работу'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Время создания'))
+
+    class Meta:
+        verbose_name = _('Обработка аватара')
+        verbose_name_plural = _('Обработка аватаров')
+        indexes = [
+            models.Index(fields=['locked_at'], name='avatarjob_locked_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}-{self.name}'
@@ -1,4 +1,34 @@
+PROTECTED_FIELDS = ('username', 'id', 'pk', 'email', 'password', 'is_active', 'is_staff', 'is_superuser')
+
+
 def activate_user(strategy, details,user=None,*args, **kwargs):
+    # Сохранение откладываем до user_details, чтобы вход по соцсети делал одну запись
     if user and not user.is_active:
         user.is_active = True
-        user.save()
+        return {'changed_fields': ['is_active']}
+
+
+def user_details(strategy, details, backend, user=None, changed_fields=(), *args, **kwargs):
+    """
+    social_core's user_details() that also saves fields changed by earlier
+    steps (activate_user), all in one UPDATE of only those columns.
+    """
+    if not user:
+        return
+    changed = list(changed_fields)
+    protected = () if strategy.setting('NO_DEFAULT_PROTECTED_USER_FIELDS', backend=backend) is True else PROTECTED_FIELDS
+    protected += tuple(strategy.setting('PROTECTED_USER_FIELDS', [], backend=backend))
+    immutable = tuple(strategy.setting('IMMUTABLE_USER_FIELDS', [], backend=backend))
+    field_mapping = strategy.setting('USER_FIELD_MAPPING', {}, backend=backend)
+    for name, value in details.items():
+        name = field_mapping.get(name, name)
+        if value is None or not hasattr(user, name) or name in protected:
+            continue
+        current = getattr(user, name, None)
+        if current == value or (name in immutable and current):
+            continue
+        setattr(user, name, value)
+        changed.append(name)
+    if changed:
+        # updated_at обновляется сам только если попадает в update_fields
+        user.save(update_fields=[*changed, 'updated_at'])
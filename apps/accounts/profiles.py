@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from accounts import metrics
+from accounts.models import User
+from accounts.serializers import ServiceUserSerializer
+
+
+def profile_key(user_id):
+    return f'user_profile:{user_id}'
+
+
+def record_key(user_id):
+    return f'user_record:{user_id}'
+
+
+def validators(user):
+    """ETag and Last-Modified of a user's profile; a snapshot's updated_at is enough, no row is loaded."""
+    updated_at = user.updated_at
+    return f'"{user.pk}-{int(updated_at.timestamp() * 1_000_000)}"', int(updated_at.timestamp())
+
+
+def not_modified(request, user):
+    """304 response if the client's copy is current, otherwise None."""
+    etag, last_modified = validators(user)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    return add_validators(response, user) if response is not None else None
+
+
+def add_validators(response, user):
+    etag, last_modified = validators(user)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Браузер хранит копию, но перед показом всегда сверяется с сервером
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def _entry_data(entry, user, origin):
+    # Ссылки на аватар абсолютные, поэтому запись годится только для того же хоста
+    if entry is not None and entry['updated_at'] == user.updated_at and entry['origin'] == origin:
+        return entry['data']
+    return None
+
+
+def get_cached(user, request):
+    with metrics.phase('cache'):
+        entry = cache.get(profile_key(user.pk))
+    return _entry_data(entry, user, request.build_absolute_uri('/'))
+
+
+async def aget_cached(user, request):
+    with metrics.phase('cache'):
+        entry = await cache.aget(profile_key(user.pk))
+    return _entry_data(entry, user, request.build_absolute_uri('/'))
+
+
+def _entry(instance, request, data):
+    return {'updated_at': instance.updated_at, 'origin': request.build_absolute_uri('/'), 'data': dict(data)}
+
+
+def set_cached(instance, request, data):
+    with metrics.phase('cache'):
+        cache.set(profile_key(instance.pk), _entry(instance, request, data), timeout=settings.PROFILE_CACHE_TIMEOUT)
+
+
+async def aset_cached(instance, request, data):
+    with metrics.phase('cache'):
+        await cache.aset(profile_key(instance.pk), _entry(instance, request, data),
+                         timeout=settings.PROFILE_CACHE_TIMEOUT)
+
+
+def get_records(ids):
+    """
+    Service records of the given users keyed by id: cached ones in one
+    round trip, the rest loaded with a single query and cached. Unknown
+    ids are absent from the result.
+    """
+    with metrics.phase('cache'):
+        cached = cache.get_many([record_key(user_id) for user_id in ids])
+    records = {user_id: cached[record_key(user_id)] for user_id in ids if record_key(user_id) in cached}
+    missing = [user_id for user_id in ids if user_id not in records]
+    if missing:
+        # Без request ссылки на файлы относительные: запись общая для всех сервисов
+        loaded = {user.pk: dict(ServiceUserSerializer(user).data) for user in User.objects.filter(pk__in=missing)}
+        with metrics.phase('cache'):
+            cache.set_many({record_key(user_id): record for user_id, record in loaded.items()},
+                           timeout=settings.PROFILE_CACHE_TIMEOUT)
+        records.update(loaded)
+    return records
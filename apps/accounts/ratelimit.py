@@ -0,0 +1,184 @@
+import functools
+import ipaddress
+import logging
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from accounts import metrics
+
+logger = logging.getLogger(__name__)
+
+Rule = namedtuple('Rule', ['name', 'key', 'limit', 'window'])
+
+# Все правила проверяются и записываются одним скриптом: либо запрос учитывается
+# во всех окнах сразу, либо ни в одном. Возвращает номер нарушенного правила или 0.
+# Время берётся у Redis, а не у сервера приложения, чтобы окна не расходились между хостами
+SLIDING_WINDOW_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 2])
+    local window = tonumber(ARGV[i * 2 + 1])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= limit then
+        return i
+    end
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[1])
+    redis.call('PEXPIRE', key, ARGV[i * 2 + 1])
+end
+return 0
+"""
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+class LocalRateLimiter:
+    """
+    In-process sliding windows; exact within one process only.
+
+    Keys whose windows have passed are dropped, on their next hit or by a
+    sweep every ``sweep_interval`` seconds, so memory follows the number of
+    recently seen keys.
+    """
+
+    def __init__(self, sweep_interval=60):
+        self._hits = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def hit(self, rules):
+        """Count one request against every rule; return the first violated Rule or None."""
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            for rule in rules:
+                hits = self._hits.get(rule.key)
+                if hits is None:
+                    continue
+                while hits and hits[0] <= now - rule.window:
+                    hits.popleft()
+                if not hits:
+                    self._drop(rule.key)
+                elif len(hits) >= rule.limit:
+                    return rule
+            for rule in rules:
+                self._hits.setdefault(rule.key, deque()).append(now)
+                self._expires[rule.key] = max(self._expires.get(rule.key, now), now + rule.window)
+        return None
+
+    def _drop(self, key):
+        del self._hits[key]
+        del self._expires[key]
+
+    def _sweep(self, now):
+        for key in [key for key, expires in self._expires.items() if expires <= now]:
+            self._drop(key)
+        self._next_sweep = now + self.sweep_interval
+
+
+class RedisRateLimiter:
+    """
+    Sliding windows in Redis sorted sets, checked and updated by one Lua
+    script per request, so every node shares the same counters.
+
+    If Redis is unreachable the request is counted by a LocalRateLimiter.
+    """
+
+    key_prefix = 'ratelimit:'
+
+    def __init__(self, alias='default'):
+        from django_redis import get_redis_connection
+        self.client = get_redis_connection(alias)
+        self.script = self.client.register_script(SLIDING_WINDOW_SCRIPT)
+        self.fallback = LocalRateLimiter()
+
+    def hit(self, rules):
+        from redis.exceptions import ConnectionError, TimeoutError
+        args = [uuid.uuid4().hex]
+        for rule in rules:
+            args += [rule.limit, int(rule.window * 1000)]
+        try:
+            with metrics.phase('cache'):
+                violated = self.script(keys=[self.key_prefix + rule.key for rule in rules], args=args)
+        except (ConnectionError, TimeoutError) as e:
+            logger.warning('Redis rate limiter unavailable, using local fallback: %s', e)
+            return self.fallback.hit(rules)
+        return rules[violated - 1] if violated else None
+
+
+def get_rate_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                if settings.CACHES['default']['BACKEND'] == 'django_redis.cache.RedisCache':
+                    _limiter = RedisRateLimiter()
+                else:
+                    _limiter = LocalRateLimiter()
+    return _limiter
+
+
+@receiver(setting_changed)
+def reset_rate_limiter(setting, **kwargs):
+    global _limiter
+    if setting == 'CACHES':
+        _limiter = None
+
+
+async def ahit(rules):
+    return await sync_to_async(get_rate_limiter().hit, thread_sensitive=False)(rules)
+
+
+@functools.lru_cache(maxsize=4)
+def _networks(proxies):
+    return [ipaddress.ip_network(proxy, strict=False) for proxy in proxies]
+
+
+def _is_trusted(address, networks):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def client_ip(request):
+    """
+    Address of the client for per-IP limits.
+
+    REMOTE_ADDR, unless it is one of TRUSTED_PROXIES: then X-Forwarded-For is
+    read from the right, skipping trusted proxies, so a client cannot pick its
+    own bucket by sending a forged header.
+    """
+    remote = request.META.get('REMOTE_ADDR')
+    networks = _networks(tuple(settings.TRUSTED_PROXIES))
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if not forwarded or not _is_trusted(remote, networks):
+        return remote
+    hops = [hop.strip() for hop in forwarded.split(',') if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, networks):
+            return hop
+    return hops[0] if hops else remote
+
+
+def code_send_rules(contact, ip):
+    rules = []
+    for name, (limit, window) in settings.CODE_SEND_LIMITS.items():
+        subject = ip if name == 'ip' else contact
+        if subject:
+            rules.append(Rule(name, f'send_code:{name}:{subject}', limit, window))
+    return rules
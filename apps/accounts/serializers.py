@@ -1,8 +1,36 @@
 import datetime
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.core.validators import FileExtensionValidator
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from django.contrib.auth.password_validation import validate_password
+from accounts import avatars, hashing
+from accounts.authentication import get_user_snapshot
+from accounts.backends import get_user_by_contact
+from accounts.codes import CodeStatus, get_code_store
 from accounts.models import User, VerificationCode
+from accounts.tokens import RefreshToken
+
+
+def check_code_status(code_status, expired_message):
+    if code_status is CodeStatus.MISSING:
+        raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Такого кода не существует']})
+    if code_status is CodeStatus.EXPIRED:
+        raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [expired_message]})
+
+
+def check_code(destination, code, expired_message):
+    check_code_status(get_code_store().check(destination, code), expired_message)
+
+
+def consume_code(destination, code, expired_message):
+    check_code_status(get_code_store().consume(destination, code), expired_message)
 
 
 class RegistrationSerializer(serializers.ModelSerializer):
@@ -33,10 +61,7 @@ class RegistrationSerializer(serializers.ModelSerializer):
         code = attrs.pop('code', None)
         if not email and not phone:
             raise serializers.ValidationError('Введите телефон или почту')
-        if email and User.objects.filter(email=email).exists():
-            raise serializers.ValidationError('Пользователь с такой почтой уже зарегистрирован')
-        if phone and User.objects.filter(phone=phone).exists():
-            raise serializers.ValidationError('Пользователь с таким номером телефона уже зарегистрирован')
+        self.check_unique(email, phone)
         if attrs.get('status') == 'EMPLOYER':
             if not attrs.get('company_name'):
                 raise serializers.ValidationError('Введите название своей компании')
@@ -44,33 +69,52 @@ class RegistrationSerializer(serializers.ModelSerializer):
             if attrs.get('company_name'):
                 raise serializers.ValidationError("Соискатель не может указывать название компании")
 
-        destination = email if email else phone
-        try:
-            verification_code = VerificationCode.objects.get(
-                code=code,
-                destination=destination,
-                is_used=False
-            )
-        except VerificationCode.DoesNotExist:
-            raise serializers.ValidationError('Такого кода не существует')
-
-        if verification_code.is_expired():
-            raise serializers.ValidationError('Время действия кода истекло')
-
-        self._verification_code = verification_code
+        # Код проверяем без погашения: неверный код не должен стоить хеширования пароля и INSERT
+        check_code(email if email else phone, code, 'Время действия кода истекло')
+        self._verification_code = (email if email else phone, code)
         return attrs
 
+    @staticmethod
+    def check_unique(email, phone):
+        if email and User.objects.filter(email=email).exists():
+            raise serializers.ValidationError('Пользователь с такой почтой уже зарегистрирован')
+        if phone and User.objects.filter(phone=phone).exists():
+            raise serializers.ValidationError('Пользователь с таким номером телефона уже зарегистрирован')
+
     def create(self, validated_data):
-        user = User.objects.create_user(**validated_data)
-        user.is_active = True
-        if user.email:
-            user.verify_email()
-        if user.phone:
-            user.verify_phone()
-        user.save()
-        if hasattr(self, '_verification_code'):
-            self._verification_code.is_used = True
-            self._verification_code.save(update_fields=['is_used'])
+        password = validated_data.pop('password')
+        user = self.build_user(validated_data)
+        # Хешируем до транзакции, чтобы не держать её открытой на время хеширования
+        hashing.set_password(user, password)
+        return self.insert(user)
+
+    @staticmethod
+    def build_user(validated_data):
+        """Unsaved user for validated data without the password."""
+        email = validated_data.pop('email', None)
+        phone = validated_data.pop('phone', None)
+        now = timezone.now()
+        return User(
+            email=User.objects.normalize_email(email) if email else None,
+            phone=phone,
+            is_active=True,
+            email_verified_at=now if email else None,
+            phone_verified_at=now if phone else None,
+            **validated_data
+        )
+
+    def insert(self, user):
+        """INSERT a user with a hashed password and consume the verification code."""
+        try:
+            with transaction.atomic():
+                user.save(force_insert=True)
+                # Код гасим после INSERT: при ошибке вставки он остаётся действительным
+                # и в хранилище Redis, где откат транзакции его бы не вернул
+                consume_code(*self._verification_code, 'Время действия кода истекло')
+        except IntegrityError:
+            # Параллельная регистрация с теми же данными прошла проверки validate() раньше нас
+            self.check_unique(user.email, user.phone)
+            raise serializers.ValidationError('Не удалось зарегистрировать пользователя, попробуйте ещё раз')
         return user
 
 
@@ -88,9 +132,14 @@ class CodeSerializer(serializers.ModelSerializer):
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
+    # FileField вместо ImageField: картинку декодирует фоновая обработка, а не поток запроса
+    avatar = serializers.FileField(required=False, validators=[FileExtensionValidator(['png', 'jpg', 'jpeg'])])
+    avatar_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = User
-        fields=['id','email','first_name','last_name','phone','company_name','avatar','birth_day','status','gender']
+        fields=['id','email','first_name','last_name','phone','company_name','avatar','avatar_variants','birth_day',
+                'status','gender']
         read_only_fields=['id','status']
 
     def update(self, instance, validated_data):
@@ -100,7 +149,25 @@ class UserProfileSerializer(serializers.ModelSerializer):
             validated_data.pop('phone')
         if instance.status != 'EMPLOYER' and 'company_name' in validated_data:
             validated_data.pop('company_name')
-        return super().update(instance, validated_data)
+        if 'avatar' not in validated_data:
+            return super().update(instance, validated_data)
+
+        previous, previous_variants = instance.avatar.name, instance.avatar_variants
+        # Пока варианты не готовы, клиент получает оригинал
+        validated_data['avatar_variants'] = {}
+        # Задача пишется вместе с новым аватаром: если воркер перезапустится до обработки, её подберёт очередь
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            avatars.schedule(instance.pk, instance.avatar.name, previous, previous_variants)
+        return instance
+
+    def get_avatar_variants(self, obj):
+        return avatars.variant_urls(obj.avatar_variants, self.context.get('request'))
+
+    def validate_avatar(self, value):
+        if not avatars.has_image_signature(value):
+            raise serializers.ValidationError('Загрузите изображение в формате PNG или JPEG')
+        return value
 
     def to_representation(self, instance):
         representation=super().to_representation(instance)
@@ -120,6 +187,27 @@ class UserProfileSerializer(serializers.ModelSerializer):
         return value
 
 
+class ServiceUserSerializer(UserProfileSerializer):
+    """Read-only profile record handed out to other services."""
+
+    class Meta(UserProfileSerializer.Meta):
+        read_only_fields = UserProfileSerializer.Meta.fields
+
+
+SERVICE_USER_FIELDS = tuple(ServiceUserSerializer.Meta.fields)
+
+
+class ServiceLookupSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+    fields = serializers.MultipleChoiceField(choices=SERVICE_USER_FIELDS, required=False)
+
+    def validate_ids(self, value):
+        if len(value) > settings.SERVICE_LOOKUP_MAX_IDS:
+            raise serializers.ValidationError(f'Не больше {settings.SERVICE_LOOKUP_MAX_IDS} идентификаторов за запрос')
+        # Порядок ответа совпадает с порядком запроса, повторы убираем
+        return list(dict.fromkeys(value))
+
+
 class LoginSerializerWithPassword(serializers.Serializer):
     email = serializers.EmailField(required=False)
     phone = serializers.CharField(required=False)
@@ -132,19 +220,12 @@ class LoginSerializerWithPassword(serializers.Serializer):
 
         if not email and not phone:
             raise serializers.ValidationError('Введите номер телефона или адрес электронной почты')
-        user = None
-        if email:
-            try:
-                User.objects.get(email=email)
-            except User.DoesNotExist:
-                raise serializers.ValidationError('Пользователя с такой почтой не существует')
-            user = authenticate(email=email, password=password)
-        elif phone:
-            try:
-                User.objects.get(phone=phone)
-            except User.DoesNotExist:
-                raise serializers.ValidationError('Пользователя с таким номером телефона не существует')
-            user = authenticate(phone=phone, password=password)
+        user = get_user_by_contact(email=email, phone=phone)
+        if user is None and email:
+            raise serializers.ValidationError('Пользователя с такой почтой не существует')
+        if user is None:
+            raise serializers.ValidationError('Пользователя с таким номером телефона не существует')
+        user = authenticate(self.context.get('request'), user=user, password=password)
         if not user:
             raise serializers.ValidationError('Неверные данные пользователя для входа')
         attrs['user'] = user
@@ -163,43 +244,18 @@ class LoginSerializerWithCode(serializers.Serializer):
         if not email and not phone:
             raise serializers.ValidationError('Введите номер телефона или адрес электронной почты')
 
-        destination = None
-        if email:
-            destination = email
-            try:
-                User.objects.get(email=email)
-            except User.DoesNotExist:
-                raise serializers.ValidationError('Пользователя с такой почтой не существует')
-        elif phone:
-            destination = phone
-            try:
-                User.objects.get(phone=phone)
-            except User.DoesNotExist:
-                raise serializers.ValidationError('Пользователя с таким номером телефона не существует')
+        destination = email if email else phone
+        user = get_user_by_contact(email=email, phone=phone)
+        if user is None and email:
+            raise serializers.ValidationError('Пользователя с такой почтой не существует')
+        if user is None:
+            raise serializers.ValidationError('Пользователя с таким номером телефона не существует')
 
         code_serializer = CodeSerializer(data={'code': code})
         if not code_serializer.is_valid():
             raise serializers.ValidationError(code_serializer.errors)
 
-        try:
-            verification_code = VerificationCode.objects.get(
-                destination=destination,
-                code=code,
-                is_used=False
-            )
-        except VerificationCode.DoesNotExist:
-            raise serializers.ValidationError('Такого кода не существует')
-
-        if verification_code.is_expired():
-            raise serializers.ValidationError('Срок действия кода уже истек')
-        if email:
-            user = User.objects.get(email=email)
-        elif phone:
-            user = User.objects.get(phone=phone)
-        else:
-            raise serializers.ValidationError('Пользователь не существует')
-        verification_code.is_used = True
-        verification_code.save(update_fields=['is_used'])
+        consume_code(destination, code, 'Срок действия кода уже истек')
 
         attrs['user'] = user
         return attrs
@@ -231,49 +287,68 @@ class PasswordResetSerializer(serializers.Serializer):
         code_serializer = CodeSerializer(data={'code': code})
         if not code_serializer.is_valid():
             raise serializers.ValidationError(code_serializer.errors)
-        try:
-            verification_code = VerificationCode.objects.get(code=code, is_used=False,destination=destination)
-        except VerificationCode.DoesNotExist:
-            raise serializers.ValidationError('Такого кода не существует')
-
-        if verification_code.is_expired():
-            raise serializers.ValidationError('Время действия кода истекло')
-
-        self._verification_code = verification_code
+        # Без верного кода пользователя не ищем и пароль не сравниваем, иначе ответы выдают,
+        # существует ли контакт и совпадает ли угаданный пароль с текущим
+        check_code(destination, code, 'Время действия кода истекло')
+        self._verification_code = (destination, code)
         return attrs
 
     def save(self, **kwargs):
         validated_data =self.validated_data
-        try:
-            if validated_data.get('email'):
-                user=User.objects.get(email=validated_data.get('email'))
-            else:
-                user=User.objects.get(phone=validated_data.get('phone'))
-        except User.DoesNotExist:
+        user=get_user_by_contact(email=validated_data.get('email'), phone=validated_data.get('phone'))
+        if user is None:
             raise serializers.ValidationError('Данного пользователя не существует')
 
-        if user.check_password(validated_data.get('new_password')):
+        if hashing.check_password(validated_data.get('new_password'), user.password):
             raise serializers.ValidationError('Пароли не должны совпадать ')
 
-        user.set_password(validated_data.get('new_password'))
-        user.save()
+        hashing.set_password(user, validated_data.get('new_password'))
+        return self.persist(user)
 
-        self._verification_code.is_used = True
-        self._verification_code.save(update_fields=['is_used'])
+    def persist(self, user):
+        """Save a user with the new password hashed and consume the verification code."""
+        with transaction.atomic():
+            consume_code(*self._verification_code, 'Время действия кода истекло')
+            user.save()
         return user
 
 class SocialAuthSerializer(serializers.Serializer):
     access_token = serializers.CharField(
+        required=False,
         help_text='Токен доступа, полученный от провайдера'
     )
+    id_token = serializers.CharField(
+        required=False,
+        help_text='ID-токен Google; проверяется без запроса к Google'
+    )
 
+    def validate(self, attrs):
+        if not attrs.get('access_token') and not attrs.get('id_token'):
+            raise serializers.ValidationError('Передайте access_token или id_token')
+        return attrs
 
 
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    token_class = RefreshToken
 
 
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    token_class = RefreshToken
 
-
-
-
-
-
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        user_id = refresh.payload.get(jwt_settings.USER_ID_CLAIM)
+        if user_id:
+            snapshot = get_user_snapshot(user_id)
+            if snapshot is None or not snapshot['is_active']:
+                raise AuthenticationFailed(
+                    self.error_messages['no_active_account'],
+                    'no_active_account',
+                )
+
+        data = {'access': str(refresh.access_token)}
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            refresh.rotate()
+            data['refresh'] = str(refresh)
+        return data
@@ -0,0 +1,22 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from accounts.authentication import snapshot_key, snapshot_version_key
+from accounts.models import User
+from accounts.profiles import profile_key, record_key
+
+
+def invalidate_user(user_id):
+    """Drop cached copies of a user; call after changing the row with QuerySet.update()."""
+    cache.set(snapshot_version_key(user_id), uuid.uuid4().hex, timeout=settings.USER_SNAPSHOT_TIMEOUT)
+    cache.delete_many([snapshot_key(user_id), profile_key(user_id), record_key(user_id)])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_snapshot(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
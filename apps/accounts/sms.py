@@ -0,0 +1,109 @@
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+
+# Сообщения, отправленные через LocMemSMSBackend (аналог django.core.mail.outbox)
+outbox = []
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+class BaseSMSBackend:
+    """
+    Base class for SMS transports, modelled after Django email backends.
+
+    Instances are long-lived and shared by every thread of the process, so
+    subclasses keep their connections open between sends.
+    """
+
+    def __init__(self, max_concurrency=None, **kwargs):
+        self.max_concurrency = max_concurrency or settings.SMS_MAX_CONCURRENCY
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='sms')
+
+    def send_message(self, to, body):
+        raise NotImplementedError('subclasses of BaseSMSBackend must override send_message()')
+
+    def send_messages(self, messages):
+        """
+        Send (to, body) pairs concurrently over the shared connections.
+
+        Returns a list aligned with ``messages``: None for a delivered message
+        or the exception raised while sending it.
+        """
+        return list(self._executor.map(self._send_safely, messages))
+
+    async def asend_messages(self, messages):
+        """send_messages() for async code: waits on the backend's own pool without holding a thread."""
+        return await asyncio.gather(*(
+            asyncio.wrap_future(self._executor.submit(self._send_safely, message)) for message in messages
+        ))
+
+    def _send_safely(self, message):
+        try:
+            self.send_message(*message)
+        except Exception as e:
+            return e
+        return None
+
+
+class TwilioSMSBackend(BaseSMSBackend):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        http_client = TwilioHttpClient(pool_connections=True, timeout=settings.SMS_TIMEOUT)
+        # Пул keep-alive соединений по числу потоков, иначе лишние потоки открывают новые TLS-сессии
+        http_client.session.mount('https://', HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.max_concurrency,
+            max_retries=settings.SMS_MAX_RETRIES,
+        ))
+        self.client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN, http_client=http_client)
+
+    def send_message(self, to, body):
+        self.client.messages.create(
+            body=body,
+            from_=settings.TWILIO_MOBILE_NUMBER,
+            to=to
+        )
+
+
+class LocMemSMSBackend(BaseSMSBackend):
+    """Fake transport for tests and benchmarks; SMS_FAKE_LATENCY emulates the provider round trip."""
+
+    def send_message(self, to, body):
+        if settings.SMS_FAKE_LATENCY:
+            time.sleep(settings.SMS_FAKE_LATENCY)
+        outbox.append((to, body))
+
+
+class ConsoleSMSBackend(BaseSMSBackend):
+    def send_message(self, to, body):
+        sys.stdout.write(f'SMS to {to}: {body}\n')
+        sys.stdout.flush()
+
+
+def get_sms_backend():
+    """Return the process-wide SMS backend configured by SMS_BACKEND."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.SMS_BACKEND)()
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_sms_backend(setting, **kwargs):
+    global _backend
+    if setting.startswith('SMS_'):
+        _backend = None
@@ -0,0 +1,90 @@
+import socket
+import socketserver
+import threading
+import time
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """
+    Minimal SMTP server that accepts and drops every message.
+
+    ``server.connect_latency`` is slept before the greeting and again on AUTH
+    to emulate the TCP/TLS handshake and login cost of a real provider.
+    """
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+            server.sockets.add(self.connection)
+        try:
+            self.serve()
+        finally:
+            with server.lock:
+                server.sockets.discard(self.connection)
+
+    def serve(self):
+        server = self.server
+        time.sleep(server.connect_latency)
+        self.reply('220 localhost SMTP sink')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().split(' ', 1)[0].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250-localhost')
+                self.reply('250 AUTH PLAIN LOGIN')
+            elif command == 'AUTH':
+                time.sleep(server.connect_latency)
+                self.reply('235 Authentication successful')
+            elif command == 'MAIL' and server.drop_mail:
+                # Обрыв посреди отправки, как при падении соединения у провайдера
+                with server.lock:
+                    server.drop_mail -= 1
+                return
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                with server.lock:
+                    server.received += 1
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=1025, connect_latency=0.0):
+        super().__init__((host, port), SMTPSinkHandler)
+        self.connect_latency = connect_latency
+        self.received = 0
+        self.connections = 0
+        # Сколько следующих команд MAIL оборвать закрытием соединения
+        self.drop_mail = 0
+        self.sockets = set()
+        self.lock = threading.Lock()
+
+    def drop_connections(self):
+        """Close every open client connection, as a server-side idle timeout does."""
+        with self.lock:
+            sockets = list(self.sockets)
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,79 @@
+import hashlib
+import threading
+
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from accounts import metrics
+from accounts.jwt_verifier import TokenVerifier
+
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v3/certs'
+GOOGLE_ISSUERS = ['accounts.google.com', 'https://accounts.google.com']
+BACKENDS = ('google-oauth2', 'yandex-oauth2')
+
+_google_verifier = None
+_lock = threading.Lock()
+
+
+def get_google_verifier():
+    """
+    Verifier of Google ID tokens against Google's public certificates.
+
+    The certificates are fetched once and kept for SOCIAL_GOOGLE_CERTS_LIFESPAN
+    seconds; a token signed with a key not seen yet triggers one refetch.
+    Raises ImproperlyConfigured if SOCIAL_AUTH_GOOGLE_OAUTH2_KEY is not set.
+    """
+    global _google_verifier
+    if _google_verifier is None:
+        with _lock:
+            if _google_verifier is None:
+                # Без client ID проверять aud нечем, а токен, выданный другому приложению, принимать нельзя
+                if not settings.SOCIAL_AUTH_GOOGLE_OAUTH2_KEY:
+                    raise ImproperlyConfigured('SOCIAL_AUTH_GOOGLE_OAUTH2_KEY is required to verify Google ID tokens')
+                _google_verifier = TokenVerifier(
+                    GOOGLE_CERTS_URL,
+                    audience=settings.SOCIAL_AUTH_GOOGLE_OAUTH2_KEY,
+                    issuer=GOOGLE_ISSUERS,
+                    algorithms=('RS256',),
+                    token_type=None,
+                    leeway=30,
+                    cache_seconds=settings.SOCIAL_GOOGLE_CERTS_LIFESPAN,
+                )
+    return _google_verifier
+
+
+@receiver(setting_changed)
+def reset_google_verifier(setting, **kwargs):
+    global _google_verifier
+    if setting in ('SOCIAL_AUTH_GOOGLE_OAUTH2_KEY', 'SOCIAL_GOOGLE_CERTS_LIFESPAN'):
+        _google_verifier = None
+
+
+def verify_google_id_token(id_token):
+    """Claims of a Google ID token checked locally, or None if it is invalid or the email is unverified."""
+    try:
+        claims = get_google_verifier().verify(id_token)
+    except jwt.InvalidTokenError:
+        return None
+    return claims if claims.get('email_verified') else None
+
+
+def get_user_data(backend, access_token):
+    """
+    Provider userinfo for an access token, cached for SOCIAL_USERINFO_CACHE_TIMEOUT
+    seconds so repeated logins with the same token skip the HTTP call.
+    """
+    key = f'social_userinfo:{backend.name}:{hashlib.sha256(access_token.encode()).hexdigest()}'
+    with metrics.phase('cache'):
+        data = cache.get(key)
+    if data is None:
+        data = backend.user_data(access_token)
+        if not data:
+            return None
+        with metrics.phase('cache'):
+            cache.set(key, data, timeout=settings.SOCIAL_USERINFO_CACHE_TIMEOUT)
+    return {**data, 'access_token': access_token}
@@ -1,3 +1,1043 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import pathlib
+import smtplib
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, identify_hasher
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import EmailMessage, get_connection
+from django.core.management import call_command
+from django.db import DatabaseError, OperationalError, connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+import jwt
+from PIL import Image
+from psycopg2 import extensions
+from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from accounts import avatars, delivery, hashing, mail, metrics, sms, social
+from accounts.admin import EstimatedCountPaginator
+from accounts.authentication import UserSnapshot, get_user_snapshot, snapshot_key, snapshot_version_key
+from accounts.codes import CodeStatus, RedisCodeStore
+from accounts.management.commands import prune_token_blacklist
+from accounts.models import AvatarJob, DeliveryJob, User, VerificationCode
+from accounts.ratelimit import LocalRateLimiter, RedisRateLimiter, Rule, client_ip
+from accounts.serializers import RegistrationSerializer
+from accounts.smtp_sink import SMTPSink
+from accounts.sms import LocMemSMSBackend, get_sms_backend
+from accounts.tokens import DatabaseTokenState, RedisTokenState, RefreshToken, get_token_state
+from accounts.views import RATE_LIMIT_MESSAGES
+from uasz_portal.db.postgresql_pool.base import ConnectionPool
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+REDIS_TEST_URL = os.getenv('REDIS_TEST_URL')
+
+
+def race(func, callers=20):
+    """Call ``func`` from ``callers`` threads released at once; return the results."""
+    barrier = threading.Barrier(callers)
+    results = []
+
+    def call():
+        barrier.wait()
+        results.append(func())
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class FlakySMSBackend(LocMemSMSBackend):
+    """LocMem transport that fails for numbers starting with +000 and counts its instances."""
+
+    instances = 0
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        type(self).instances += 1
+
+    def send_message(self, to, body):
+        if to.startswith('+000'):
+            raise ConnectionError(f'{to} is unreachable')
+        super().send_message(to, body)
+
+
+@override_settings(SMS_BACKEND='accounts.tests.FlakySMSBackend', SMS_MAX_CONCURRENCY=4, SMS_FAKE_LATENCY=0)
+class SMSBackendTests(SimpleTestCase):
+    messages = [('+79990000001', 'a'), ('+0001', 'b'), ('+79990000002', 'c')]
+
+    def setUp(self):
+        sms.outbox.clear()
+
+    def assertIsolated(self, errors):
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], ConnectionError)
+        self.assertIsNone(errors[2])
+        self.assertCountEqual(sms.outbox, [self.messages[0], self.messages[2]])
+
+    def test_batch_errors_stay_with_their_message(self):
+        self.assertIsolated(get_sms_backend().send_messages(self.messages))
+
+    async def test_async_batch_errors_stay_with_their_message(self):
+        self.assertIsolated(await get_sms_backend().asend_messages(self.messages))
+
+    def test_backend_is_built_once_per_process(self):
+        # Класс берём как его импортирует get_sms_backend(): модуль тестов может быть загружен под двумя именами
+        backend_class = import_string(settings.SMS_BACKEND)
+        backend_class.instances = 0
+        sms.reset_sms_backend('SMS_BACKEND')
+        backends = race(get_sms_backend)
+        self.assertEqual(len({id(backend) for backend in backends}), 1)
+        self.assertEqual(backend_class.instances, 1)
+
+
+@override_settings(EMAIL_POOL_SIZE=4, EMAIL_POOL_MAX_AGE=300, EMAIL_POOL_IDLE_CHECK=300)
+class PooledEmailBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.sink = SMTPSink(port=0)
+        self.sink.start()
+        self.addCleanup(self.sink.server_close)
+        self.addCleanup(self.sink.shutdown)
+        self.addCleanup(self.close_pools)
+
+    @staticmethod
+    def close_pools():
+        for pool in mail._pools.values():
+            while not pool.empty():
+                mail.PooledEmailBackend._discard(pool.get_nowait()[0])
+        mail._pools.clear()
+
+    def backend(self, **kwargs):
+        return get_connection(
+            'accounts.mail.PooledEmailBackend', host='127.0.0.1', port=self.sink.server_address[1],
+            username='', password='', use_tls=False, **kwargs,
+        )
+
+    def send(self, **kwargs):
+        return self.backend(**kwargs).send_messages([EmailMessage('Код', '123456', 'noreply@example.com', ['user@example.com'])])
+
+    def test_connection_is_reused(self):
+        self.assertEqual(self.send() + self.send(), 2)
+        self.assertEqual((self.sink.connections, self.sink.received), (1, 2))
+
+    @override_settings(EMAIL_POOL_IDLE_CHECK=0)
+    def test_noop_probe_discards_dead_connection(self):
+        self.send()
+        self.sink.drop_connections()
+        self.assertEqual(self.send(), 1)
+        self.assertEqual((self.sink.connections, self.sink.received), (2, 2))
+
+    @override_settings(EMAIL_POOL_MAX_AGE=0)
+    def test_old_connection_is_rotated(self):
+        self.send()
+        self.send()
+        self.assertEqual((self.sink.connections, self.sink.received), (2, 2))
+
+    def test_disconnect_is_retried_once(self):
+        self.sink.drop_mail = 1
+        self.assertEqual(self.send(), 1)
+        self.assertEqual((self.sink.connections, self.sink.received), (2, 1))
+
+    def test_broken_connection_is_not_pooled(self):
+        self.sink.drop_mail = 2
+        self.assertEqual(self.send(fail_silently=True), 0)
+        self.assertEqual(self.sink.connections, 2)
+        self.assertTrue(all(pool.empty() for pool in mail._pools.values()))
+        self.sink.drop_mail = 2
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            self.send()
+        self.assertTrue(all(pool.empty() for pool in mail._pools.values()))
+
+
+class LocalRateLimiterTests(SimpleTestCase):
+    def test_concurrent_sends_exactly_one_wins(self):
+        rule = Rule('contact', 'send_code:contact:user@example.com', 1, 60)
+        limiter = LocalRateLimiter()
+        results = race(lambda: limiter.hit([rule]))
+        self.assertEqual(results.count(None), 1)
+        self.assertEqual(results.count(rule), len(results) - 1)
+
+    def test_rejected_request_does_not_consume_other_windows(self):
+        limiter = LocalRateLimiter()
+        contact = Rule('contact', 'contact:a', 1, 60)
+        daily = Rule('destination_daily', 'daily:a', 2, 86400)
+        self.assertIsNone(limiter.hit([contact, daily]))
+        self.assertEqual(limiter.hit([contact, daily]), contact)
+        self.assertIsNone(limiter.hit([daily]))
+        self.assertEqual(limiter.hit([daily]), daily)
+
+    def test_expired_keys_are_dropped(self):
+        limiter = LocalRateLimiter(sweep_interval=0)
+        limiter.hit([Rule('ip', 'ip:a', 5, 0.01)])
+        time.sleep(0.02)
+        limiter.hit([Rule('ip', 'ip:b', 5, 60)])
+        self.assertEqual(list(limiter._hits), ['ip:b'])
+
+
+class ClientIPTests(SimpleTestCase):
+    def ip(self, remote, forwarded):
+        return client_ip(RequestFactory().get('/', REMOTE_ADDR=remote, HTTP_X_FORWARDED_FOR=forwarded))
+
+    def test_forwarded_header_ignored_from_untrusted_peer(self):
+        self.assertEqual(self.ip('203.0.113.7', '198.51.100.1'), '203.0.113.7')
+
+    @override_settings(TRUSTED_PROXIES=['10.0.0.0/8', '192.0.2.10'])
+    def test_rightmost_untrusted_hop_is_the_client(self):
+        self.assertEqual(self.ip('10.0.0.5', '198.51.100.1'), '198.51.100.1')
+        self.assertEqual(self.ip('10.0.0.5', 'forged, 198.51.100.1, 192.0.2.10'), '198.51.100.1')
+        self.assertEqual(self.ip('10.0.0.5', '10.1.1.1'), '10.1.1.1')
+        self.assertEqual(self.ip('203.0.113.7', '198.51.100.1'), '203.0.113.7')
+
+
+@unittest.skipUnless(REDIS_TEST_URL, 'REDIS_TEST_URL is not set')
+class RedisRateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        caches = {'default': {'BACKEND': 'django_redis.cache.RedisCache', 'LOCATION': REDIS_TEST_URL}}
+        with override_settings(CACHES=caches):
+            self.limiter = RedisRateLimiter()
+        self.rule = Rule('contact', f'test:{self.id()}', 1, 60)
+        self.limiter.client.delete(self.limiter.key_prefix + self.rule.key)
+
+    def test_concurrent_sends_exactly_one_wins(self):
+        results = race(lambda: self.limiter.hit([self.rule]))
+        self.assertEqual(results.count(None), 1)
+
+    def test_window_uses_redis_clock(self):
+        self.limiter.hit([self.rule])
+        [(_, score)] = self.limiter.client.zrange(self.limiter.key_prefix + self.rule.key, 0, -1, withscores=True)
+        seconds, micros = self.limiter.client.time()
+        self.assertAlmostEqual(score, seconds * 1000 + micros // 1000, delta=1000)
+
+
+@unittest.skipUnless(REDIS_TEST_URL, 'REDIS_TEST_URL is not set')
+class RedisCodeStoreTests(SimpleTestCase):
+    def setUp(self):
+        caches = {'default': {'BACKEND': 'django_redis.cache.RedisCache', 'LOCATION': REDIS_TEST_URL}}
+        with override_settings(CACHES=caches):
+            self.store = RedisCodeStore()
+        self.destination = f'{self.id()}@example.com'
+        self.key = self.store.make_key(self.destination, '123456')
+        self.addCleanup(self.store.client.delete, self.key)
+
+    def issue(self, seconds=300):
+        self.store.issue(self.destination, '123456', 'EMAIL', timezone.now() + datetime.timedelta(seconds=seconds))
+
+    def test_code_is_stored_under_hmac_with_ttl(self):
+        self.issue()
+        keys = [key.decode() for key in self.store.client.keys(f'{self.store.key_prefix}*')]
+        self.assertIn(self.key, keys)
+        self.assertFalse(any('123456' in key or self.destination in key for key in keys))
+        self.assertTrue(0 < self.store.client.ttl(self.key) <= 300)
+
+    def test_code_is_consumed_once(self):
+        self.issue()
+        results = race(lambda: self.store.consume(self.destination, '123456'))
+        self.assertEqual(results.count(CodeStatus.VALID), 1)
+        self.assertEqual(results.count(CodeStatus.MISSING), len(results) - 1)
+
+    def test_expired_code_is_missing(self):
+        self.issue(seconds=1)
+        time.sleep(1.2)
+        self.assertIs(self.store.consume(self.destination, '123456'), CodeStatus.MISSING)
+        self.issue(seconds=-1)
+        self.assertFalse(self.store.client.exists(self.key))
+
+    def test_check_does_not_consume(self):
+        self.issue()
+        self.assertIs(self.store.check(self.destination, '123456'), CodeStatus.VALID)
+        self.assertIs(self.store.check(self.destination, '654321'), CodeStatus.MISSING)
+        self.assertIs(self.store.consume(self.destination, '123456'), CodeStatus.VALID)
+        self.assertIs(self.store.check(self.destination, '123456'), CodeStatus.MISSING)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PruneTokenBlacklistTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(email='prune@example.com')
+        now = timezone.now()
+        for i in range(7):
+            token = OutstandingToken.objects.create(
+                user=user, jti=f'jti-{i}', token='-', created_at=now - datetime.timedelta(days=2),
+                expires_at=now + datetime.timedelta(hours=-1 if i < 5 else 1),
+            )
+            if i % 2:
+                BlacklistedToken.objects.create(token=token)
+        self.archive = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'tokens.jsonl')
+
+    def prune(self):
+        call_command('prune_token_blacklist', '--batch-size=2', '--pause=0', f'--archive={self.archive}',
+                     stdout=io.StringIO())
+
+    def test_interrupted_run_resumes_without_duplicates(self):
+        original = prune_token_blacklist.Archiver.__call__
+        batches = []
+
+        def interrupted(archiver, pks):
+            original(archiver, pks)
+            batches.append(pks)
+            # Вторая пачка записана в архив, но не удалена
+            if len(batches) == 2:
+                raise KeyboardInterrupt
+
+        with unittest.mock.patch.object(prune_token_blacklist.Archiver, '__call__', interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                self.prune()
+        self.assertEqual(OutstandingToken.objects.count(), 5)
+        self.prune()
+
+        with open(self.archive) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row['jti'] for row in rows], [f'jti-{i}' for i in range(5)])
+        self.assertEqual([row['blacklisted_at'] is not None for row in rows], [False, True, False, True, False])
+        self.assertEqual(set(rows[0]), {'id', 'jti', 'user_id', 'created_at', 'expires_at', 'blacklisted_at'})
+        self.assertCountEqual(OutstandingToken.objects.values_list('jti', flat=True), ['jti-5', 'jti-6'])
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+
+@unittest.skipUnless(REDIS_TEST_URL, 'REDIS_TEST_URL is not set')
+class TokenBlacklistCopyTests(TestCase):
+    def setUp(self):
+        redis_caches = {'default': {'BACKEND': 'django_redis.cache.RedisCache', 'LOCATION': REDIS_TEST_URL}}
+        self.enterContext(override_settings(CACHES=redis_caches))
+        user = User.objects.create_user(email='tokens@example.com', is_active=True)
+        with self.settings(TOKEN_STATE_BACKEND='accounts.tokens.DatabaseTokenState'):
+            self.revoked = RefreshToken.for_user(user)
+            self.revoked.blacklist()
+            self.active = RefreshToken.for_user(user)
+        state = RedisTokenState()
+        self.addCleanup(state.client.delete, state._jti_key(self.revoked))
+
+    def test_tokens_revoked_before_switch_stay_revoked(self):
+        call_command('copy_token_blacklist_to_redis', stdout=io.StringIO())
+        with self.settings(TOKEN_STATE_BACKEND='accounts.tokens.RedisTokenState'):
+            self.assertTrue(get_token_state().is_blacklisted(self.revoked))
+            self.assertFalse(get_token_state().is_blacklisted(self.active))
+            with self.assertRaises(TokenError):
+                RefreshToken(str(self.revoked))
+
+
+class FakeConnection:
+    """Enough of a psycopg2 connection for ConnectionPool."""
+
+    def __init__(self):
+        self.closed = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def pool(self, max_size=2, timeout=1, idle_check=30):
+        return ConnectionPool(max_size=max_size, timeout=timeout, max_age=1800, idle_check=idle_check)
+
+    def test_returned_connection_is_reused(self):
+        pool = self.pool()
+        first = pool.acquire(FakeConnection, lambda c: True)
+        self.assertEqual(pool.stats()['in_use'], 1)
+        pool.release(first)
+        self.assertIs(pool.acquire(FakeConnection, lambda c: True), first)
+        stats = pool.stats()
+        self.assertEqual((stats['checkouts'], stats['created'], stats['in_use'], stats['idle']), (2, 1, 1, 0))
+
+    def test_exhausted_pool_times_out(self):
+        pool = self.pool(max_size=1, timeout=0.05)
+        pool.acquire(FakeConnection, lambda c: True)
+        with self.assertRaisesMessage(OperationalError, 'connection pool exhausted'):
+            pool.acquire(FakeConnection, lambda c: True)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_open_transaction_is_rolled_back_on_return(self):
+        pool = self.pool()
+        conn = pool.acquire(FakeConnection, lambda c: True)
+        conn.status = extensions.TRANSACTION_STATUS_INTRANS
+        pool.release(conn)
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertIs(pool.acquire(FakeConnection, lambda c: True), conn)
+
+    def test_broken_connection_is_discarded(self):
+        pool = self.pool(idle_check=0)
+        closed = pool.acquire(FakeConnection, lambda c: True)
+        closed.closed = 1
+        pool.release(closed)
+        self.assertEqual(pool.stats()['idle'], 0)
+        # Соединение, не прошедшее SELECT 1 после простоя, тоже не выдаётся
+        dead = pool.acquire(FakeConnection, lambda c: True)
+        pool.release(dead)
+        fresh = pool.acquire(FakeConnection, lambda c: False)
+        self.assertIsNot(fresh, dead)
+        self.assertTrue(dead.closed)
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['discarded']), (3, 2))
+
+
+class HealthViewTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_database_ok(self):
+        response = self.client.get('/api/health/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'database': 'ok'})
+
+    def test_pool_stats_are_reported(self):
+        pool = ConnectionPool(max_size=3, timeout=1, max_age=1800, idle_check=30)
+        with unittest.mock.patch.object(connection, 'pool', pool, create=True):
+            response = self.client.get('/api/health/')
+        self.assertEqual(response.json()['pool']['max_size'], 3)
+
+    def test_database_down_is_503(self):
+        with unittest.mock.patch.object(connection, 'ensure_connection', side_effect=DatabaseError):
+            response = self.client.get('/api/health/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {'database': 'unavailable'})
+
+
+class MetricsDirTests(SimpleTestCase):
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(METRICS_ENABLED=True, METRICS_DIR=directory))
+        self.addCleanup(setattr, metrics, '_retired', False)
+        self.histogram = metrics.Histogram('test_seconds', 'Test.', ('route',))
+        self.enterContext(unittest.mock.patch.object(metrics, 'HISTOGRAMS', (self.histogram,)))
+        # Второй воркер, уже записавший свои счётчики
+        metrics._write(os.path.join(directory, 'metrics-1.json'), {'test_seconds': {('login',): [1] + [0] * 13 + [0.001]}})
+
+    def count(self):
+        return sum(metrics.collect()['test_seconds'][('login',)][:-1])
+
+    def test_scrape_sums_all_workers_and_survives_exit(self):
+        self.histogram.observe(20, 'login')
+        self.assertEqual(self.count(), 2)
+        metrics.retire()
+        # Счётчики завершившегося воркера остаются в сумме, новые наблюдения он больше не пишет
+        self.histogram.observe(20, 'login')
+        self.assertEqual(self.count(), 2)
+
+
+class TokenStateTests(SimpleTestCase):
+    @override_settings(CACHES=LOCMEM_CACHES, TOKEN_STATE_BACKEND='')
+    def test_falls_back_to_database_without_redis_cache(self):
+        self.assertIsInstance(get_token_state(), DatabaseTokenState)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    VERIFICATION_CODE_STORE='accounts.codes.ModelCodeStore',
+)
+class CodeSendViewTests(TestCase):
+    def test_second_send_within_a_minute_is_rejected(self):
+        first = self.client.post('/api/send-code/', {'email': 'user@example.com'}, content_type='application/json')
+        second = self.client.post('/api/send-code/', {'email': 'user@example.com'}, content_type='application/json')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 429)
+
+    def send(self, contact, remote='10.0.0.5', forwarded=None):
+        extra = {'REMOTE_ADDR': remote}
+        if forwarded:
+            extra['HTTP_X_FORWARDED_FOR'] = forwarded
+        return self.client.post('/api/send-code/', {'email': contact}, content_type='application/json', **extra)
+
+    @override_settings(
+        CODE_SEND_LIMITS={'contact': (1, 60), 'ip': (2, 3600), 'destination_daily': (10, 86400)},
+        TRUSTED_PROXIES=['10.0.0.0/8'],
+    )
+    def test_ip_rule_counts_clients_behind_trusted_proxy(self):
+        self.assertEqual(self.send('ip1@example.com', forwarded='203.0.113.7').status_code, 200)
+        self.assertEqual(self.send('ip2@example.com', forwarded='203.0.113.7').status_code, 200)
+        # Подделанный клиентом левый адрес не уводит запрос в чужую корзину
+        third = self.send('ip3@example.com', forwarded='198.51.100.1, 203.0.113.7')
+        self.assertEqual(third.status_code, 429)
+        self.assertEqual(third.json()['message'], RATE_LIMIT_MESSAGES['ip'])
+        self.assertEqual(self.send('ip4@example.com', forwarded='203.0.113.8').status_code, 200)
+
+    @override_settings(CODE_SEND_LIMITS={'contact': (10, 60), 'ip': (20, 3600), 'destination_daily': (2, 86400)})
+    def test_daily_rule_counts_across_addresses(self):
+        self.assertEqual(self.send('daily@example.com', remote='192.0.2.1').status_code, 200)
+        self.assertEqual(self.send('daily@example.com', remote='192.0.2.2').status_code, 200)
+        third = self.send('daily@example.com', remote='192.0.2.3')
+        self.assertEqual(third.status_code, 429)
+        self.assertEqual(third.json()['message'], RATE_LIMIT_MESSAGES['destination_daily'])
+
+    async def test_async_send_stores_code_and_job_atomically(self):
+        with unittest.mock.patch.object(delivery, 'create_job', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                await self.async_client.post('/api/async/send-code/', {'email': 'atomic@example.com'},
+                                             content_type='application/json')
+        self.assertFalse(await VerificationCode.objects.filter(destination='atomic@example.com').aexists())
+
+    async def test_async_send_shares_limits_with_sync_view(self):
+        first = await self.async_client.post('/api/async/send-code/', {'email': 'async@example.com'}, content_type='application/json')
+        second = self.client.post('/api/send-code/', {'email': 'async@example.com'}, content_type='application/json')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 429)
+
+
+@override_settings(DELIVERY_MAX_ATTEMPTS=1)
+class DeliveryJobTests(TestCase):
+    def test_failed_job_drops_code_and_is_pruned(self):
+        job = DeliveryJob.objects.create(channel='EMAIL', destination='user@example.com', message='Код: 123456',
+                                         status='SENDING', attempts=1)
+        delivery._finish(job, Exception('smtp down'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.message), ('FAILED', ''))
+
+        DeliveryJob.objects.filter(pk=job.pk).update(created_at=timezone.now() - datetime.timedelta(days=2))
+        pending = DeliveryJob.objects.create(channel='EMAIL', destination='user@example.com', message='Код: 654321')
+        call_command('prune_delivery_jobs', '--retention-hours=24', '--pause=0', stdout=io.StringIO())
+        self.assertEqual(list(DeliveryJob.objects.values_list('pk', flat=True)), [pending.pk])
+
+
+class FastPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    iterations = 1
+
+
+UPGRADE_HASHERS = ['accounts.tests.FastPBKDF2PasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+@override_settings(PASSWORD_HASHING_EXECUTOR='thread', PASSWORD_HASHING_WORKERS=2)
+class HashingPoolTests(SimpleTestCase):
+    def test_slots_bound_running_hashes(self):
+        release = threading.Event()
+        callers = [threading.Thread(target=lambda: hashing.submit(release.wait).result()) for _ in range(4)]
+        for caller in callers:
+            caller.start()
+        for _ in range(100):
+            if hashing.stats()['waiting'] == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(hashing.stats(), {'workers': 2, 'executor': 'thread', 'waiting': 2, 'running': 2})
+        release.set()
+        for caller in callers:
+            caller.join()
+        self.assertEqual((hashing.stats()['waiting'], hashing.stats()['running']), (0, 0))
+
+    @override_settings(PASSWORD_HASHERS=UPGRADE_HASHERS)
+    async def test_async_hash_round_trip(self):
+        encoded = await hashing.amake_password('Sup3r-secret!')
+        self.assertTrue(check_password('Sup3r-secret!', encoded))
+        self.assertTrue(await hashing.acheck_password('Sup3r-secret!', encoded))
+        self.assertFalse(await hashing.acheck_password('wrong-password', encoded))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PASSWORD_HASHERS=UPGRADE_HASHERS)
+class PasswordUpgradeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='old@example.com', is_active=True)
+        with self.settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+            hashing.set_password(self.user, 'Sup3r-secret!')
+        self.user.save()
+
+    def algorithm(self):
+        self.user.refresh_from_db()
+        return identify_hasher(self.user.password).algorithm
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        self.assertFalse(hashing.verify_user_password(self.user, 'wrong-password'))
+        self.assertEqual(self.algorithm(), 'md5')
+        self.assertTrue(hashing.verify_user_password(self.user, 'Sup3r-secret!'))
+        self.assertEqual(self.algorithm(), 'pbkdf2_sha256')
+        self.assertTrue(hashing.verify_user_password(self.user, 'Sup3r-secret!'))
+
+    async def test_outdated_hash_is_upgraded_on_async_login(self):
+        self.assertTrue(await hashing.averify_user_password(self.user, 'Sup3r-secret!'))
+        self.assertEqual(await sync_to_async(self.algorithm)(), 'pbkdf2_sha256')
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EmailOrPhoneBackendTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='login@example.com', phone='+79991234567',
+                                             password='Sup3r-secret!', is_active=True)
+
+    def test_login_by_email_or_phone(self):
+        self.assertEqual(authenticate(None, email='login@example.com', password='Sup3r-secret!'), self.user)
+        self.assertEqual(authenticate(None, phone='+79991234567', password='Sup3r-secret!'), self.user)
+
+    def test_wrong_password_and_inactive_user_are_rejected(self):
+        self.assertIsNone(authenticate(None, email='login@example.com', password='wrong-password'))
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(authenticate(None, email='login@example.com', password='Sup3r-secret!'))
+
+    def test_unknown_user_still_costs_a_hash(self):
+        with unittest.mock.patch.object(hashing, 'make_password', wraps=hashing.make_password) as make_password:
+            self.assertIsNone(authenticate(None, email='nobody@example.com', password='Sup3r-secret!'))
+        make_password.assert_called_once_with('Sup3r-secret!')
+
+    async def test_async_login_checks_password_of_inactive_user(self):
+        await User.objects.filter(pk=self.user.pk).aupdate(is_active=False)
+        with unittest.mock.patch.object(hashing, 'acheck_password', wraps=hashing.acheck_password) as acheck_password:
+            response = await self.async_client.post('/api/async/login/password/', {
+                'email': 'login@example.com', 'password': 'Sup3r-secret!',
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        acheck_password.assert_called_once()
+
+
+class PruneVerificationCodesTests(TestCase):
+    def code(self, hours, is_used=False):
+        return VerificationCode.objects.create(
+            code='123456', destination='user@example.com', is_used=is_used, type='EMAIL',
+            expired_at=timezone.now() + datetime.timedelta(hours=hours),
+        )
+
+    def test_stale_codes_are_deleted_in_batches(self):
+        for hours in (-48, -30, -26):
+            self.code(hours)
+            self.code(hours, is_used=True)
+        live = [self.code(1).pk, self.code(1, is_used=True).pk, self.code(-1).pk]
+        out = io.StringIO()
+        call_command('prune_verification_codes', '--retention-hours=24', '--batch-size=4', '--pause=0',
+                     verbosity=2, stdout=out)
+        self.assertEqual(out.getvalue().splitlines()[:2], ['Deleted 4 codes', 'Deleted 6 codes'])
+        self.assertCountEqual(VerificationCode.objects.values_list('pk', flat=True), live)
+
+    def test_stale_lookup_uses_expiry_index(self):
+        # Планировщик Postgres на почти пустой таблице выбирает seq scan, план стабилен только в SQLite
+        if connection.vendor != 'sqlite':
+            self.skipTest('query plan is checked on SQLite only')
+        plan = VerificationCode.objects.stale(datetime.timedelta(hours=24)).explain()
+        self.assertIn('vcode_expired_at_idx', plan)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    VERIFICATION_CODE_STORE='accounts.codes.ModelCodeStore',
+)
+class PasswordResetTests(TestCase):
+    def setUp(self):
+        User.objects.create_user(email='reset@example.com', password='Old-pass-123', is_active=True)
+        self.code = VerificationCode.objects.create(
+            code='123456', destination='reset@example.com', is_used=False,
+            expired_at=timezone.now() + datetime.timedelta(minutes=5), type='EMAIL',
+        )
+
+    def reset(self, code, new_password):
+        return self.client.post('/api/password-reset/', {
+            'email': 'reset@example.com', 'code': code, 'new_password': new_password,
+        }, content_type='application/json')
+
+    def test_wrong_code_does_not_reveal_current_password(self):
+        response = self.reset('654321', 'Old-pass-123')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'non_field_errors': ['Такого кода не существует']})
+
+    def test_same_password_keeps_code(self):
+        self.assertEqual(self.reset('123456', 'Old-pass-123').status_code, 400)
+        self.assertEqual(self.reset('123456', 'New-pass-456').status_code, 200)
+        self.code.refresh_from_db()
+        self.assertTrue(self.code.is_used)
+
+    async def test_async_reset_hashes_in_the_pool_only(self):
+        with unittest.mock.patch.object(hashing, 'make_password', wraps=hashing.make_password) as make_password:
+            response = await self.async_client.post('/api/async/password-reset/', {
+                'email': 'reset@example.com', 'code': '123456', 'new_password': 'New-pass-456',
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        make_password.assert_not_called()
+        user = await User.objects.aget(email='reset@example.com')
+        self.assertTrue(await sync_to_async(user.check_password)('New-pass-456'))
+        self.assertFalse(await VerificationCode.objects.filter(pk=self.code.pk, is_used=False).aexists())
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    VERIFICATION_CODE_STORE='accounts.codes.ModelCodeStore',
+    TOKEN_STATE_BACKEND='accounts.tokens.DatabaseTokenState',
+)
+class RegistrationTests(TestCase):
+    def setUp(self):
+        self.code = VerificationCode.objects.create(
+            code='123456', destination='new@example.com', is_used=False,
+            expired_at=timezone.now() + datetime.timedelta(minutes=5), type='EMAIL',
+        )
+        self.data = {'email': 'new@example.com', 'password': 'Str0ng-pass', 'status': 'APPLICANT', 'code': '123456'}
+
+    def test_user_is_created_verified_and_active(self):
+        response = self.client.post('/api/register/', self.data, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(email='new@example.com')
+        self.assertTrue(user.is_active)
+        self.assertIsNotNone(user.email_verified_at)
+        self.code.refresh_from_db()
+        self.assertTrue(self.code.is_used)
+
+    async def test_async_registration_hashes_in_the_pool_only(self):
+        with unittest.mock.patch.object(hashing, 'make_password', wraps=hashing.make_password) as make_password:
+            response = await self.async_client.post('/api/async/register/', self.data, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        make_password.assert_not_called()
+        user = await User.objects.aget(email='new@example.com')
+        self.assertTrue(await sync_to_async(user.check_password)('Str0ng-pass'))
+        self.assertFalse(await VerificationCode.objects.filter(pk=self.code.pk, is_used=False).aexists())
+
+    def test_wrong_code_is_rejected_in_validation(self):
+        serializer = RegistrationSerializer(data={**self.data, 'code': '654321'})
+        # Уникальность почты (валидатор поля и validate()) и код, без хеширования пароля и вставки
+        with self.assertNumQueries(3):
+            self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors, {'non_field_errors': ['Такого кода не существует']})
+
+    def test_duplicate_registered_after_validation_is_rejected(self):
+        serializer = RegistrationSerializer(data=self.data)
+        self.assertTrue(serializer.is_valid())
+        User.objects.create_user(email='new@example.com', password='Str0ng-pass')
+        with self.assertRaisesMessage(ValidationError, 'Пользователь с такой почтой уже зарегистрирован'):
+            serializer.save()
+        self.code.refresh_from_db()
+        self.assertFalse(self.code.is_used)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AvatarProcessingTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.user = User.objects.create_user(email='avatar@example.com', password='Sup3r-secret!')
+
+    def upload(self, content):
+        name = default_storage.save('images/avatars/test.png', ContentFile(content))
+        User.objects.filter(pk=self.user.pk).update(avatar=name)
+        return name
+
+    def test_variants_replace_previous_files(self):
+        buffer = io.BytesIO()
+        Image.new('RGBA', (800, 600), (200, 10, 10, 128)).save(buffer, 'PNG')
+        first = self.upload(buffer.getvalue())
+        old_variants = avatars.process_avatar(self.user.pk, first)
+        second = self.upload(buffer.getvalue())
+        variants = avatars.process_avatar(self.user.pk, second, first, old_variants)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_variants, variants)
+        with default_storage.open(variants['small']['webp']) as f:
+            self.assertEqual(Image.open(f).size, (64, 64))
+        self.assertFalse(any(default_storage.exists(name) for name in [first, *avatars.variant_names(old_variants)]))
+
+    def test_broken_image_falls_back_to_default(self):
+        name = self.upload(b'\x89PNG\r\n\x1a\n' + b'0' * 100)
+        self.assertIsNone(avatars.process_avatar(self.user.pk, name))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar.name, avatars.DEFAULT_AVATAR)
+        self.assertFalse(default_storage.exists(name))
+
+    def png(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (300, 300), (10, 200, 10)).save(buffer, 'PNG')
+        return self.upload(buffer.getvalue())
+
+    def test_job_is_stored_with_the_upload_and_removed_when_done(self):
+        name = self.png()
+        with self.captureOnCommitCallbacks() as callbacks:
+            job = avatars.schedule(self.user.pk, name)
+        self.assertEqual(len(callbacks), 1)
+        avatars.run_job(job)
+        self.assertFalse(AvatarJob.objects.exists())
+        self.user.refresh_from_db()
+        self.assertEqual(set(self.user.avatar_variants), {'small', 'medium'})
+
+    @override_settings(AVATAR_LOCK_TIMEOUT=60)
+    def test_abandoned_job_is_taken_over(self):
+        abandoned = AvatarJob.objects.create(user=self.user, name=self.png(),
+                                             locked_at=timezone.now() - datetime.timedelta(seconds=61))
+        AvatarJob.objects.create(user=self.user, name='images/avatars/in-progress.png')
+        jobs = avatars.claim_jobs(10)
+        self.assertEqual([(job.pk, job.attempts) for job in jobs], [(abandoned.pk, 2)])
+        self.assertEqual(avatars.claim_jobs(10), [])
+        avatars.run_job(jobs[0])
+        self.assertFalse(AvatarJob.objects.filter(pk=abandoned.pk).exists())
+
+    @override_settings(AVATAR_MAX_ATTEMPTS=2)
+    def test_failed_job_is_retried_then_dropped(self):
+        job = AvatarJob.objects.create(user=self.user, name=self.png())
+        with unittest.mock.patch.object(avatars, 'process_avatar', side_effect=RuntimeError('storage down')), \
+                self.assertLogs('accounts.avatars', 'ERROR'):
+            avatars.run_job(job)
+            self.assertTrue(AvatarJob.objects.filter(pk=job.pk).exists())
+            job.attempts = 2
+            avatars.run_job(job)
+        self.assertFalse(AvatarJob.objects.filter(pk=job.pk).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LargeTableAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='Sup3r-secret!')
+        self.client.force_login(self.admin)
+        for i in range(4):
+            VerificationCode.objects.create(
+                code=f'{i:06d}', destination=f'user{i}@example.com', is_used=False, type='EMAIL',
+                expired_at=timezone.now() + datetime.timedelta(minutes=5 if i % 2 else -5),
+            )
+
+    def paginator(self):
+        return EstimatedCountPaginator(VerificationCode.objects.filter(is_used=False).order_by('pk'), 2)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=10)
+    def test_exact_count_below_limit(self):
+        with unittest.mock.patch.object(connection, 'vendor', 'postgresql'), \
+                self.assertNumQueries(1) as queries:
+            self.assertEqual(self.paginator().count, 4)
+        self.assertIn('LIMIT 11', queries.captured_queries[0]['sql'])
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=2)
+    def test_estimate_above_limit(self):
+        with unittest.mock.patch.object(connection, 'vendor', 'postgresql'), \
+                unittest.mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=1000):
+            self.assertEqual(self.paginator().count, 1000)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=2)
+    def test_other_databases_count_exactly(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest('checks the fallback for databases without planner estimates')
+        self.assertEqual(self.paginator().count, 4)
+
+    def test_csv_export_streams_header_and_rows(self):
+        response = self.client.post('/admin/accounts/verificationcode/', {
+            'action': 'export_csv',
+            '_selected_action': VerificationCode.objects.values_list('pk', flat=True),
+        })
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="verificationcode.csv"')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], ['id', 'destination', 'type', 'is_used', 'created_at', 'expired_at'])
+        self.assertCountEqual([row[1] for row in rows[1:]], [f'user{i}@example.com' for i in range(4)])
+
+    def test_expired_is_annotated_by_the_database(self):
+        model_admin = admin.site._registry[VerificationCode]
+        request = RequestFactory().get('/admin/accounts/verificationcode/')
+        request.user = self.admin
+        codes = {code.destination: model_admin.is_expired(code) for code in model_admin.get_queryset(request)}
+        self.assertEqual(codes, {f'user{i}@example.com': not i % 2 for i in range(4)})
+        # Сортировка по колонке «Истёк» идёт по аннотации
+        response = self.client.get('/admin/accounts/verificationcode/', {'o': '3'})
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TOKEN_STATE_BACKEND='accounts.tokens.DatabaseTokenState')
+class UserSnapshotTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='snap@example.com', first_name='Ivan', is_active=True)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        self.assertEqual(self.client.get('/api/profile/').status_code, 200)
+
+    def test_deactivated_user_is_rejected(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/profile/').status_code, 401)
+
+    def test_deleted_user_is_rejected(self):
+        self.user.delete()
+        self.assertEqual(self.client.get('/api/profile/').status_code, 401)
+
+    def test_missing_attributes_load_the_full_row_once(self):
+        snapshot = UserSnapshot(get_user_snapshot(self.user.pk))
+        with self.assertNumQueries(0):
+            self.assertEqual((snapshot.pk, snapshot.email), (self.user.pk, 'snap@example.com'))
+        with self.assertNumQueries(1):
+            self.assertEqual((snapshot.first_name, snapshot.get_full_name()), ('Ivan', 'Ivan '))
+
+    def test_slow_reader_cannot_cache_a_stale_row(self):
+        # Чтение, начавшееся до деактивации: версия и строка взяты раньше, запись в кэш - позже
+        cache.delete(snapshot_key(self.user.pk))
+        version = cache.get(snapshot_version_key(self.user.pk))
+        stale = get_user_snapshot(self.user.pk)
+        self.user.is_active = False
+        self.user.save()
+        cache.set(snapshot_key(self.user.pk), (version, stale))
+        self.assertFalse(get_user_snapshot(self.user.pk)['is_active'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TOKEN_STATE_BACKEND='accounts.tokens.DatabaseTokenState')
+class ProfileConditionalGetTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(email='etag@example.com', password='Sup3r-secret!', is_active=True)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {RefreshToken.for_user(user).access_token}'
+
+    def test_unchanged_profile_is_not_modified(self):
+        etag = self.client.get('/api/profile/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_update_invalidates_etag_and_cache(self):
+        etag = self.client.get('/api/profile/')['ETag']
+        self.client.patch('/api/profile/', {'first_name': 'Ivan'}, content_type='application/json')
+        response = self.client.get('/api/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['first_name'], 'Ivan')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ImportUsersTests(TestCase):
+    def test_invalid_and_duplicate_rows_are_rejected(self):
+        User.objects.create_user(email='taken@example.com')
+        rows = [
+            {'email': 'new@example.com', 'password': 'Sup3r-secret!'},
+            {'phone': '+375291234567', 'password_hash': 'pbkdf2_sha256$600000$salt$hash'},
+            {'email': 'new@example.com'},
+            {'email': 'taken@example.com'},
+            {'first_name': 'Без контактов'},
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path, rejects = os.path.join(tmp, 'users.jsonl'), os.path.join(tmp, 'rejects.jsonl')
+            with open(path, 'w') as f:
+                f.writelines(json.dumps(row) + '\n' for row in rows)
+            call_command('import_users', path, rejects=rejects, workers=1, verbosity=0, stdout=io.StringIO())
+            with open(rejects) as f:
+                rejected = [json.loads(line)['line'] for line in f]
+
+        self.assertEqual(sorted(rejected), [3, 4, 5])
+        self.assertTrue(User.objects.get(email='new@example.com').check_password('Sup3r-secret!'))
+        self.assertEqual(User.objects.get(phone='+375291234567').password, 'pbkdf2_sha256$600000$salt$hash')
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SERVICE_TOKENS={'billing': 'service-secret'})
+class ServiceUserLookupTests(TestCase):
+    def lookup(self, data, token='service-secret'):
+        return self.client.post('/api/service/users/', data, content_type='application/json',
+                                HTTP_AUTHORIZATION=f'Service {token}')
+
+    def test_batch_lookup_uses_cache_and_reports_missing(self):
+        users = [User.objects.create_user(email=f'svc{i}@example.com', first_name=f'User {i}') for i in range(3)]
+        ids = [user.pk for user in users] + [10 ** 6]
+        with self.assertNumQueries(1):
+            first = self.lookup({'ids': ids, 'fields': ['first_name']})
+        users[0].first_name = 'Renamed'
+        users[0].save()
+        with self.assertNumQueries(1):
+            second = self.lookup({'ids': ids, 'fields': ['first_name']})
+
+        self.assertEqual(first.json()['missing'], [10 ** 6])
+        self.assertEqual(first.json()['users'][1], {'id': users[1].pk, 'first_name': 'User 1'})
+        self.assertEqual(second.json()['users'][0]['first_name'], 'Renamed')
+
+    def test_unknown_service_token_is_rejected(self):
+        self.assertEqual(self.lookup({'ids': [1]}, token='wrong').status_code, 401)
+
+
+GOOGLE_CLIENT_ID = 'client.apps.googleusercontent.com'
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TOKEN_STATE_BACKEND='accounts.tokens.DatabaseTokenState')
+class GoogleIdTokenTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = {**jwt.algorithms.RSAAlgorithm.to_jwk(cls.key.public_key(), as_dict=True), 'kid': 'google', 'alg': 'RS256'}
+        certs = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+        with certs:
+            json.dump({'keys': [jwk]}, certs)
+        cls.addClassCleanup(os.unlink, certs.name)
+        # Сертификаты Google читаются из локального файла, без сети
+        cls.enterClassContext(unittest.mock.patch.object(social, 'GOOGLE_CERTS_URL', pathlib.Path(certs.name).as_uri()))
+        cls.enterClassContext(override_settings(SOCIAL_AUTH_GOOGLE_OAUTH2_KEY=GOOGLE_CLIENT_ID))
+
+    def id_token(self, **claims):
+        now = int(time.time())
+        claims = {
+            'iss': 'https://accounts.google.com', 'aud': GOOGLE_CLIENT_ID, 'sub': '1001', 'iat': now,
+            'exp': now + 300, 'email': 'google@example.com', 'email_verified': True, 'given_name': 'Ivan',
+            **claims,
+        }
+        return jwt.encode(claims, self.key, algorithm='RS256', headers={'kid': 'google'})
+
+    def login(self, **claims):
+        return self.client.post('/api/social/google-oauth2/', {'id_token': self.id_token(**claims)},
+                                content_type='application/json')
+
+    def test_valid_token_logs_in(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(pk=response.json()['user_id'])
+        self.assertEqual((user.email, user.first_name), ('google@example.com', 'Ivan'))
+
+    def test_invalid_tokens_are_rejected(self):
+        for claims in ({'aud': 'other.apps.googleusercontent.com'}, {'iss': 'https://evil.example.com'},
+                       {'email_verified': False}):
+            with self.subTest(**claims):
+                self.assertEqual(self.login(**claims).status_code, 400)
+        self.assertFalse(User.objects.filter(email='google@example.com').exists())
+
+    def test_missing_client_id_fails_closed(self):
+        with override_settings(SOCIAL_AUTH_GOOGLE_OAUTH2_KEY=None):
+            with self.assertRaises(ImproperlyConfigured):
+                social.verify_google_id_token(self.id_token())
+
+    def test_repeat_login_reactivates_and_updates_in_one_save(self):
+        user_id = self.login().json()['user_id']
+        User.objects.filter(pk=user_id).update(is_active=False, first_name='Old')
+        with unittest.mock.patch.object(User, 'save', autospec=True, side_effect=User.save) as save:
+            response = self.login(given_name='Petr')
+        self.assertEqual(response.json()['user_id'], user_id)
+        user = User.objects.get(pk=user_id)
+        self.assertEqual((user.is_active, user.first_name), (True, 'Petr'))
+        [call] = save.call_args_list
+        self.assertCountEqual(call.kwargs['update_fields'], ['is_active', 'first_name', 'updated_at'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TOKEN_STATE_BACKEND='accounts.tokens.DatabaseTokenState')
+class KeyringTests(TestCase):
+    def setUp(self):
+        keys_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(keys_dir.cleanup)
+        call_command('generate_jwt_key', algorithm='EdDSA', dir=keys_dir.name, stdout=io.StringIO())
+        self.enterContext(override_settings(JWT_KEYS_DIR=keys_dir.name))
+        self.keys_dir = keys_dir.name
+        self.user = User.objects.create_user(email='jwks@example.com', is_active=True)
+
+    def test_tokens_verify_against_published_jwks(self):
+        response = self.client.get('/.well-known/jwks.json')
+        self.assertIn('max-age', response['Cache-Control'])
+        [jwk] = response.json()['keys']
+        access = str(RefreshToken.for_user(self.user).access_token)
+
+        self.assertEqual(jwt.get_unverified_header(access)['kid'], jwk['kid'])
+        claims = jwt.decode(access, jwt.PyJWK(jwk).key, algorithms=[jwk['alg']])
+        self.assertEqual(claims['user_id'], self.user.pk)
+        profile = self.client.get('/api/profile/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(profile.status_code, 200)
+
+    def test_tokens_of_retired_key_stay_valid_after_rotation(self):
+        old_access = str(RefreshToken.for_user(self.user).access_token)
+        old_kid = jwt.get_unverified_header(old_access)['kid']
+        call_command('generate_jwt_key', algorithm='RS256', dir=self.keys_dir, bits=2048, stdout=io.StringIO())
+        [new_kid] = {name[:-len('.pem')] for name in os.listdir(self.keys_dir)} - {old_kid}
+        with override_settings(JWT_KEYS_DIR=self.keys_dir, JWT_SIGNING_KID=new_kid):
+            new_access = str(RefreshToken.for_user(self.user).access_token)
+            kids = [jwk['kid'] for jwk in self.client.get('/.well-known/jwks.json').json()['keys']]
+            old_profile = self.client.get('/api/profile/', HTTP_AUTHORIZATION=f'Bearer {old_access}')
+        self.assertEqual(jwt.get_unverified_header(new_access)['kid'], new_kid)
+        self.assertCountEqual(kids, [old_kid, new_kid])
+        self.assertEqual(old_profile.status_code, 200)
@@ -0,0 +1,222 @@
+import math
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken as BaseAccessToken, BlacklistMixin, RefreshToken as BaseRefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from accounts import keys, metrics
+
+FAMILY_CLAIM = 'fam'
+
+_state = None
+_state_lock = threading.Lock()
+
+
+class BaseTokenState:
+    """
+    Storage for refresh token state: issued tokens, rotation and revocation.
+
+    Refresh tokens carry a ``fam`` claim shared by every token rotated from
+    the same login, so a backend can revoke a whole family at once.
+    """
+
+    def outstand(self, token):
+        raise NotImplementedError('subclasses of BaseTokenState must override outstand()')
+
+    def is_blacklisted(self, token):
+        raise NotImplementedError('subclasses of BaseTokenState must override is_blacklisted()')
+
+    def blacklist(self, token):
+        raise NotImplementedError('subclasses of BaseTokenState must override blacklist()')
+
+    def rotate(self, token):
+        """Blacklist a token being rotated; return False if it had already been used."""
+        raise NotImplementedError('subclasses of BaseTokenState must override rotate()')
+
+
+class DatabaseTokenState(BaseTokenState):
+    """The token_blacklist tables, as used by simplejwt itself."""
+
+    def _outstanding(self, token):
+        outstanding, _ = OutstandingToken.objects.get_or_create(
+            jti=token[api_settings.JTI_CLAIM],
+            defaults={
+                'user_id': token.get(api_settings.USER_ID_CLAIM),
+                'created_at': token.current_time,
+                'token': str(token),
+                'expires_at': datetime_from_epoch(token['exp']),
+            },
+        )
+        return outstanding
+
+    def outstand(self, token):
+        self._outstanding(token)
+
+    def is_blacklisted(self, token):
+        return BlacklistedToken.objects.filter(token__jti=token[api_settings.JTI_CLAIM]).exists()
+
+    def blacklist(self, token):
+        BlacklistedToken.objects.get_or_create(token=self._outstanding(token))
+
+    def rotate(self, token):
+        _, created = BlacklistedToken.objects.get_or_create(token=self._outstanding(token))
+        return created
+
+
+class RedisTokenState(BaseTokenState):
+    """
+    Keeps only blacklisted jtis and revoked families in Redis, each with a
+    TTL equal to the remaining token lifetime; issuing a token writes nothing.
+
+    Presenting a refresh token that was already rotated is treated as theft
+    and revokes its whole family.
+
+    Tokens blacklisted in the database before switching to this backend are
+    carried over by the copy_token_blacklist_to_redis command.
+    """
+
+    key_prefix = 'jwt:'
+
+    def __init__(self, alias='default'):
+        from django_redis import get_redis_connection
+        self.client = get_redis_connection(alias)
+
+    def _jti_key(self, token):
+        return self.jti_key(token[api_settings.JTI_CLAIM])
+
+    def jti_key(self, jti):
+        return f'{self.key_prefix}bl:{jti}'
+
+    def _family_key(self, family):
+        return f'{self.key_prefix}fam:{family}'
+
+    def _ttl(self, token):
+        leeway = token.get_token_backend().get_leeway().total_seconds()
+        return math.ceil(token['exp'] + leeway - timezone.now().timestamp())
+
+    def revoke_family(self, family):
+        with metrics.phase('cache'):
+            self.client.set(self._family_key(family), 1, ex=int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()))
+
+    def outstand(self, token):
+        pass
+
+    def is_blacklisted(self, token):
+        family = token.get(FAMILY_CLAIM)
+        keys = [self._jti_key(token)]
+        if family:
+            keys.append(self._family_key(family))
+        with metrics.phase('cache'):
+            reason, *family_revoked = self.client.mget(keys)
+        if reason == b'rotated' and family:
+            self.revoke_family(family)
+        return reason is not None or any(family_revoked)
+
+    def _set(self, token, reason):
+        ttl = self._ttl(token)
+        if ttl <= 0:
+            return True
+        with metrics.phase('cache'):
+            return bool(self.client.set(self._jti_key(token), reason, ex=ttl, nx=True))
+
+    def blacklist(self, token):
+        self._set(token, 'revoked')
+
+    def rotate(self, token):
+        if self._set(token, 'rotated'):
+            return True
+        if token.get(FAMILY_CLAIM):
+            self.revoke_family(token[FAMILY_CLAIM])
+        return False
+
+
+def get_token_state():
+    """
+    Return the process-wide token state backend configured by TOKEN_STATE_BACKEND,
+    or, if it is empty, RedisTokenState when the default cache is django_redis
+    and DatabaseTokenState otherwise.
+    """
+    global _state
+    if _state is None:
+        with _state_lock:
+            if _state is None:
+                if settings.TOKEN_STATE_BACKEND:
+                    _state = import_string(settings.TOKEN_STATE_BACKEND)()
+                elif settings.CACHES['default']['BACKEND'] == 'django_redis.cache.RedisCache':
+                    _state = RedisTokenState()
+                else:
+                    _state = DatabaseTokenState()
+    return _state
+
+
+@receiver(setting_changed)
+def reset_token_state(setting, **kwargs):
+    global _state
+    if setting in ('TOKEN_STATE_BACKEND', 'CACHES'):
+        _state = None
+
+
+class TimedTokenMixin:
+    """Attributes JWT decoding and encoding to the "jwt" metrics phase."""
+
+    def __init__(self, *args, **kwargs):
+        with metrics.phase('jwt'):
+            super().__init__(*args, **kwargs)
+
+    def __str__(self):
+        with metrics.phase('jwt'):
+            return super().__str__()
+
+
+class KeyringTokenMixin:
+    """Signs and verifies through accounts.keys, so the JWT_KEYS_DIR keyring is used when configured."""
+
+    def get_token_backend(self):
+        return keys.get_token_backend()
+
+
+class AccessToken(KeyringTokenMixin, TimedTokenMixin, BaseAccessToken):
+    pass
+
+
+class RefreshToken(KeyringTokenMixin, TimedTokenMixin, BaseRefreshToken):
+    """RefreshToken whose outstanding/blacklist bookkeeping goes through get_token_state()."""
+
+    access_token_class = AccessToken
+    no_copy_claims = BaseRefreshToken.no_copy_claims + (FAMILY_CLAIM,)
+
+    def check_blacklist(self):
+        if get_token_state().is_blacklisted(self):
+            raise TokenError(_('Token is blacklisted'))
+
+    def outstand(self):
+        get_token_state().outstand(self)
+
+    def blacklist(self):
+        get_token_state().blacklist(self)
+
+    def rotate(self):
+        """Blacklist this token and turn it into the next token of its family."""
+        if api_settings.BLACKLIST_AFTER_ROTATION and not get_token_state().rotate(self):
+            raise TokenError(_('Token is blacklisted'))
+        self.set_jti()
+        self.set_exp()
+        self.set_iat()
+        self.outstand()
+
+    @classmethod
+    def for_user(cls, user):
+        # Пропускаем BlacklistMixin.for_user: он пишет OutstandingToken напрямую
+        token = super(BlacklistMixin, cls).for_user(user)
+        token[FAMILY_CLAIM] = token[api_settings.JTI_CLAIM]
+        token.outstand()
+        return token
@@ -8,7 +8,20 @@ from accounts.views import (
     LoginWithCodeView,
     UserProfileView,
     PasswordResetView,
-    LogoutView
+    LogoutView,
+    SocialLoginView,
+    HealthView,
+    ServiceUserLookupView,
+    metrics_view,
+    jwks_view
+)
+from accounts.async_views import (
+    AsyncCodeSendView,
+    AsyncRegisterView,
+    AsyncLoginWithPasswordView,
+    AsyncLoginWithCodeView,
+    AsyncUserProfileView,
+    AsyncPasswordResetView,
 )
 app_name='accounts'
 urlpatterns = [
@@ -19,4 +32,16 @@ urlpatterns = [
     path('api/profile/', UserProfileView.as_view(), name='user-profile'),
     path('api/password-reset/', PasswordResetView.as_view(), name='password-reset'),
     path('api/logout/', LogoutView.as_view(), name='logout'),
+    path('api/social/<str:backend>/', SocialLoginView.as_view(), name='social-login'),
+    path('api/health/', HealthView.as_view(), name='health'),
+    path('api/service/users/', ServiceUserLookupView.as_view(), name='service-user-lookup'),
+    path('metrics', metrics_view, name='metrics'),
+    path('.well-known/jwks.json', jwks_view, name='jwks'),
+
+    path('api/async/send-code/', AsyncCodeSendView.as_view(), name='async-send-code'),
+    path('api/async/register/', AsyncRegisterView.as_view(), name='async-register'),
+    path('api/async/login/password/', AsyncLoginWithPasswordView.as_view(), name='async-login-with-password'),
+    path('api/async/login/code/', AsyncLoginWithCodeView.as_view(), name='async-login-with-code'),
+    path('api/async/profile/', AsyncUserProfileView.as_view(), name='async-user-profile'),
+    path('api/async/password-reset/', AsyncPasswordResetView.as_view(), name='async-password-reset'),
 ]
\ No newline at end of file
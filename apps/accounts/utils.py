@@ -0,0 +1,79 @@
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection, send_mail
+
+from accounts.sms import get_sms_backend
+
+
+EMAIL_SUBJECT='Ваш код подтверждения'
+
+
+def send_on_email(email,message):
+    send_mail(
+        subject=EMAIL_SUBJECT,
+        message=message,
+        from_email=settings.EMAIL_HOST_USER,
+        recipient_list=[email],
+        fail_silently=False
+    )
+
+
+def send_on_email_batch(messages):
+    # Одна SMTP-сессия на всю пачку
+    connection=get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        return [e] * len(messages)
+    errors=[]
+    try:
+        for email, message in messages:
+            try:
+                EmailMessage(
+                    subject=EMAIL_SUBJECT,
+                    body=message,
+                    from_email=settings.EMAIL_HOST_USER,
+                    to=[email],
+                    connection=connection,
+                ).send()
+            except Exception as e:
+                errors.append(e)
+            else:
+                errors.append(None)
+    finally:
+        connection.close()
+    return errors
+
+
+def send_on_phone(phone,text):
+    get_sms_backend().send_message(phone, text)
+
+
+def send_on_phone_batch(messages):
+    return get_sms_backend().send_messages(messages)
+
+
+async def asend_on_phone_batch(messages):
+    return await get_sms_backend().asend_messages(messages)
+
+
+def delete_in_batches(queryset, batch_size=1000, pause=0, before_delete=None):
+    """
+    Delete the rows of ``queryset`` in primary-key batches, each in its own
+    short statement, so no long-lived lock is held. Yields the size of every
+    deleted batch.
+
+    ``before_delete`` is called with each batch's primary keys, in
+    ascending order, before the batch is deleted.
+    """
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        if before_delete is not None:
+            before_delete(pks)
+        queryset.model._base_manager.filter(pk__in=pks).delete()
+        yield len(pks)
+        if pause:
+            time.sleep(pause)
@@ -1,56 +1,43 @@
-from django.core.mail import send_mail
 import random
 
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import RetrieveUpdateAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
-from django.core.cache import cache
-from twilio.base.exceptions import TwilioRestException
-from social_django.utils import psa
-from accounts.models import VerificationCode
+from django.db import DatabaseError, connection, transaction
+from requests import RequestException
+from social_core.exceptions import SocialAuthBaseException
+from social_django.utils import load_backend, load_strategy
+from accounts import delivery, keys, metrics, profiles, social
+from accounts.authentication import IsService, ServiceTokenAuthentication, UserSnapshot
+from accounts.codes import get_code_store
+from accounts.ratelimit import client_ip, code_send_rules, get_rate_limiter
+from accounts.tokens import RefreshToken
 from accounts.serializers import RegistrationSerializer, LoginSerializerWithPassword, LoginSerializerWithCode, \
-    UserProfileSerializer, PasswordResetSerializer, SocialAuthSerializer
-from uasz_portal import settings
-from twilio.rest import Client
+    UserProfileSerializer, PasswordResetSerializer, SocialAuthSerializer, ServiceLookupSerializer, SERVICE_USER_FIELDS
 
 def generate_code():
     return f'{random.randint(0,999999):06d}'
 
-def send_on_email(email,message):
-    subject='Ваш код подтверждения'
-    send_mail(
-        subject=subject,
-        message=message,
-        from_email=settings.EMAIL_HOST_USER,
-        recipient_list=[email],
-        fail_silently=False
-    )
-
-def send_on_phone(phone,text):
-    client=Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-    try:
-        client.messages.create(
-            body=text,
-            from_=settings.TWILIO_MOBILE_NUMBER,
-            to=phone
-        )
-    except TwilioRestException as e:
-        print(f"Twilio Error: {e}")
-
-
-def can_send_code(contact):
-    last_send_time=cache.get(f'last_sent_{contact}')
-    if last_send_time:
-        elapsed_time=(timezone.now() - last_send_time).total_seconds()
-        if elapsed_time<60:
-            return False
-    cache.set(f'last_sent_{contact}', timezone.now(),timeout=600)
-    return True
+
+RATE_LIMIT_MESSAGES={
+    'contact':'Код можно отправлять раз в 60 секунд',
+    'ip':'Слишком много запросов кода с вашего адреса, попробуйте позже',
+    'destination_daily':'Превышен дневной лимит кодов для этого адресата',
+}
+
+
+def can_send_code(contact, ip=None):
+    """Return None if a code may be sent, otherwise the violated rate limit rule."""
+    return get_rate_limiter().hit(code_send_rules(contact, ip))
 
 
 class CodeSendView(APIView):
@@ -64,25 +51,18 @@ class CodeSendView(APIView):
 
         contact=email if email else phone
 
-        if not can_send_code(contact):
+        violated=can_send_code(contact, client_ip(request))
+        if violated:
             return Response({
-                'message':'Код можно отправлять раз в 60 секунд'
+                'message':RATE_LIMIT_MESSAGES[violated.name]
             },status=status.HTTP_429_TOO_MANY_REQUESTS)
 
         code=generate_code()
         expiry=timezone.now() + timezone.timedelta(minutes=10)
-        VerificationCode.objects.create(
-            code=code,
-            destination=contact,
-            is_used=False,
-            expired_at=expiry,
-            type='EMAIL' if email else 'PHONE',
-        )
-        message=f'Ваш код подтверждения {code}'
-        if email:
-            send_on_email(email,message)
-        elif phone:
-            send_on_phone(phone,message)
+        channel='EMAIL' if email else 'PHONE'
+        with transaction.atomic():
+            get_code_store().issue(contact, code, channel, expiry)
+            delivery.enqueue(channel, contact, f'Ваш код подтверждения {code}')
 
         return Response({
             'message':'Код подтверждения отправлен',
@@ -109,7 +89,7 @@ class RegisterView(APIView):
 
 class LoginWithPasswordView(APIView):
     def post(self,request,format=None):
-        serializer=LoginSerializerWithPassword(data=request.data)
+        serializer=LoginSerializerWithPassword(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         user=serializer.validated_data.get('user')
 
@@ -151,7 +131,47 @@ class UserProfileView(RetrieveUpdateAPIView):
     permission_classes=[IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        user=self.request.user
+        if isinstance(user, UserSnapshot):
+            return user.get_full_user()
+        return user
+
+    def retrieve(self, request, *args, **kwargs):
+        # Фронтенд запрашивает профиль на каждой странице: сначала 304, затем кеш, и только потом полная строка
+        user=request.user
+        response=profiles.not_modified(request, user)
+        if response is not None:
+            return response
+        data=profiles.get_cached(user, request)
+        if data is None:
+            instance=self.get_object()
+            data=self.get_serializer(instance).data
+            profiles.set_cached(instance, request, data)
+        return profiles.add_validators(Response(data), user)
+
+    def update(self, request, *args, **kwargs):
+        response=super().update(request, *args, **kwargs)
+        return profiles.add_validators(response, self.get_object())
+
+class ServiceUserLookupView(APIView):
+    """Batch lookup of user records for other services: one request instead of one profile call per user."""
+    authentication_classes=[ServiceTokenAuthentication]
+    permission_classes=[IsService]
+
+    def post(self,request,format=None):
+        serializer=ServiceLookupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids=serializer.validated_data['ids']
+        selected=serializer.validated_data.get('fields')
+        # id возвращаем всегда, чтобы записи можно было сопоставить с запросом
+        fields=[name for name in SERVICE_USER_FIELDS if not selected or name=='id' or name in selected]
+        records=profiles.get_records(ids)
+        return Response({
+            'users':[{name:records[user_id][name] for name in fields if name in records[user_id]}
+                     for user_id in ids if user_id in records],
+            'missing':[user_id for user_id in ids if user_id not in records],
+        },status=status.HTTP_200_OK)
+
 
 class PasswordResetView(APIView):
     def post(self,request,format=None):
@@ -165,6 +185,47 @@ class PasswordResetView(APIView):
         },status=status.HTTP_200_OK)
 
 
+class HealthView(APIView):
+    authentication_classes=[]
+
+    def get(self,request,format=None):
+        try:
+            connection.ensure_connection()
+            usable=connection.is_usable()
+        except DatabaseError:
+            usable=False
+        body={'database':'ok' if usable else 'unavailable'}
+        # Статистика пула есть только у бэкенда uasz_portal.db.postgresql_pool
+        if hasattr(connection, 'pool'):
+            body['pool']=connection.pool.stats()
+        return Response(body,status=status.HTTP_200_OK if usable else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+def metrics_view(request):
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN and not constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}'
+    ):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(metrics.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_GET
+def jwks_view(request):
+    keyring=keys.get_keyring()
+    if keyring is None:
+        raise Http404
+    response=get_conditional_response(request, etag=keyring.jwks_etag)
+    if response is None:
+        response=HttpResponse(keyring.jwks, content_type='application/json')
+    response['ETag']=keyring.jwks_etag
+    # Сервисы держат ключи у себя; после ротации новый kid они догружают сами
+    patch_cache_control(response, public=True, max_age=settings.JWKS_MAX_AGE,
+                        stale_while_revalidate=settings.JWKS_MAX_AGE, stale_if_error=86400)
+    return response
+
+
 class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -180,25 +241,45 @@ class LogoutView(APIView):
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
-# class SocialLoginView(APIView):
-#     @psa('social:complete')
-#     def post(self,request,*args, **kwargs):
-#         serializer=SocialAuthSerializer(data=request.data)
-#         serializer.is_valid(raise_exception=True)
-#         user=request.backend.do_auth(serializer.validated_data.get('access_token'))
-#         if user and user.is_active:
-#             refresh=RefreshToken.for_user(user)
-#             tokens={
-#                 'refresh': str(refresh),
-#                 'access': str(refresh.access_token),
-#             }
-#             return Response({
-#                 'message':'Oauth аутентификация удалась',
-#                 'user_id':user.id,
-#                 'tokens':tokens
-#             },status=status.HTTP_200_OK)
-#         else:
-#             return Response({
-#                 'error':'Ошибка аутентификации'
-#             },status=status.HTTP_400_BAD_REQUEST)
+class SocialLoginView(APIView):
+    """
+    Exchanges a provider token for our JWT pair. A Google ID token is
+    verified locally against cached Google certificates; an access token
+    goes to the provider's userinfo endpoint, cached for a short time.
+    """
+    authentication_classes=[]
 
+    def post(self,request,backend,format=None):
+        if backend not in social.BACKENDS:
+            raise Http404
+        serializer=SocialAuthSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        id_token=serializer.validated_data.get('id_token')
+        if id_token and backend!='google-oauth2':
+            raise ValidationError({'id_token':['ID-токен поддерживается только для Google']})
+
+        strategy=load_strategy(request._request)
+        auth_backend=load_backend(strategy, backend, redirect_uri=None)
+        try:
+            if id_token:
+                data=social.verify_google_id_token(id_token)
+            else:
+                data=social.get_user_data(auth_backend, serializer.validated_data['access_token'])
+            user=strategy.authenticate(auth_backend, response=data) if data else None
+        except (SocialAuthBaseException, RequestException):
+            user=None
+        if not user or not user.is_active:
+            return Response({
+                'error':'Ошибка аутентификации'
+            },status=status.HTTP_400_BAD_REQUEST)
+
+        refresh=RefreshToken.for_user(user)
+        tokens={
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+        }
+        return Response({
+            'message':'Oauth аутентификация удалась',
+            'user_id':user.id,
+            'tokens':tokens
+        },status=status.HTTP_200_OK)
@@ -0,0 +1,178 @@
+import os
+import queue
+import threading
+import time
+
+from django.db import OperationalError
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresDatabaseWrapper
+from psycopg2 import extensions
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+POOL_DEFAULTS = {
+    'MAX_SIZE': 10,
+    'TIMEOUT': 5,
+    'MAX_AGE': 1800,
+    'IDLE_CHECK': 30,
+}
+
+
+class ConnectionPool:
+    """
+    Bounded pool of open connections for one database alias in one process.
+
+    At most MAX_SIZE connections exist at a time; callers wait up to TIMEOUT
+    seconds for a free one. Connections idle longer than IDLE_CHECK are
+    probed with SELECT 1 before reuse and recycled after MAX_AGE.
+    """
+
+    def __init__(self, max_size, timeout, max_age, idle_check):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.idle_check = idle_check
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._in_use = {}
+        self._waiting = 0
+        self._counters = dict(checkouts=0, created=0, discarded=0, timeouts=0, wait_seconds=0.0)
+
+    def acquire(self, connect, check):
+        with self._lock:
+            self._waiting += 1
+        started = time.monotonic()
+        acquired = self._slots.acquire(timeout=self.timeout)
+        waited = time.monotonic() - started
+        with self._lock:
+            self._waiting -= 1
+            self._counters['wait_seconds'] += waited
+            if not acquired:
+                self._counters['timeouts'] += 1
+        if not acquired:
+            raise OperationalError(f'connection pool exhausted: {self.max_size} connections in use for {waited:.1f}s')
+        try:
+            connection, opened_at = self._checkout(connect, check)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use[id(connection)] = opened_at
+            self._counters['checkouts'] += 1
+        return connection
+
+    def _checkout(self, connect, check):
+        while True:
+            try:
+                connection, opened_at, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            now = time.monotonic()
+            if connection.closed or now - opened_at > self.max_age or (
+                now - released_at > self.idle_check and not check(connection)
+            ):
+                self._discard(connection)
+                continue
+            return connection, opened_at
+        connection = connect()
+        with self._lock:
+            self._counters['created'] += 1
+        return connection, time.monotonic()
+
+    def release(self, connection):
+        with self._lock:
+            opened_at = self._in_use.pop(id(connection), None)
+        if opened_at is None:
+            # Соединение открыто до fork или уже возвращено; просто закрываем
+            self._discard(connection)
+            return
+        try:
+            if not connection.closed and connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except Exception:
+            pass
+        if connection.closed or connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            self._discard(connection)
+        else:
+            self._idle.put((connection, opened_at, time.monotonic()))
+        self._slots.release()
+
+    def _discard(self, connection):
+        with self._lock:
+            self._counters['discarded'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._lock:
+            in_use = len(self._in_use)
+            return dict(
+                self._counters,
+                max_size=self.max_size,
+                in_use=in_use,
+                idle=self._idle.qsize(),
+                waiting=self._waiting,
+            )
+
+
+def get_pool(alias, options):
+    global _pools_pid
+    with _pools_lock:
+        # После fork (gunicorn --preload) пулы родителя не используем: сокеты общие
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        if alias not in _pools:
+            options = {**POOL_DEFAULTS, **options}
+            _pools[alias] = ConnectionPool(
+                max_size=options['MAX_SIZE'],
+                timeout=options['TIMEOUT'],
+                max_age=options['MAX_AGE'],
+                idle_check=options['IDLE_CHECK'],
+            )
+        return _pools[alias]
+
+
+def pool_stats():
+    """Usage counters of every pool in this process, keyed by database alias."""
+    with _pools_lock:
+        pools = dict(_pools) if _pools_pid == os.getpid() else {}
+    return {alias: pool.stats() for alias, pool in pools.items()}
+
+
+class DatabaseWrapper(PostgresDatabaseWrapper):
+    """
+    PostgreSQL backend that takes connections from a per-process pool and
+    returns them on close() instead of disconnecting.
+
+    Configured by the "POOL" key of the DATABASES entry (see POOL_DEFAULTS).
+    Django still closes the connection at the end of each request when
+    CONN_MAX_AGE is 0, which hands it back to the pool.
+    """
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict.get('POOL') or {})
+
+    def get_new_connection(self, conn_params):
+        return self.pool.acquire(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params), self._ping)
+
+    @staticmethod
+    def _ping(connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except Exception:
+            return False
+        return True
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection)
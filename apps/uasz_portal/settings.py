@@ -47,7 +47,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
@@ -55,10 +55,11 @@ REST_FRAMEWORK = {
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.google.GoogleOAuth2',
     'social_core.backends.yandex.YandexOAuth2',
-    'django.contrib.auth.backends.ModelBackend',
+    'accounts.backends.EmailOrPhoneBackend',
 )
 
 MIDDLEWARE = [
+    'accounts.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -102,6 +103,22 @@ CACHES = {
     }
 }
 
+# (лимит, окно в секундах) для /api/send-code/
+CODE_SEND_LIMITS = {
+    'contact': (1, 60),
+    'ip': (int(os.getenv('CODE_SEND_IP_LIMIT', 20)), 3600),
+    'destination_daily': (int(os.getenv('CODE_SEND_DAILY_LIMIT', 10)), 86400),
+}
+
+# Адреса или подсети балансировщиков через запятую: за ними IP клиента для лимитов берётся из X-Forwarded-For
+TRUSTED_PROXIES = [proxy.strip() for proxy in os.getenv('TRUSTED_PROXIES', '').split(',') if proxy.strip()]
+
+# По умолчанию коды хранятся в таблице VerificationCode и видны в админке. accounts.codes.RedisCodeStore
+# включается явно: коды перестают попадать в админку, а выданные до переключения перестают приниматься,
+# поэтому переключать лучше в период без активных кодов (их срок - несколько минут)
+VERIFICATION_CODE_STORE = os.getenv('VERIFICATION_CODE_STORE', 'accounts.codes.ModelCodeStore')
+VERIFICATION_CODE_RETENTION_HOURS = float(os.getenv('VERIFICATION_CODE_RETENTION_HOURS', 24))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -121,6 +138,9 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+PASSWORD_HASHING_EXECUTOR = os.getenv('PASSWORD_HASHING_EXECUTOR', 'thread')
+PASSWORD_HASHING_WORKERS = int(os.getenv('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -145,6 +165,9 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Режим сервера из gunicorn.conf.py: wsgi или asgi
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+
 DATABASES = {
     "default": {
         "ENGINE": os.getenv("SQL_ENGINE"),
@@ -153,6 +176,21 @@ DATABASES = {
         "PASSWORD": os.getenv("SQL_PASSWORD"),
         "HOST": os.getenv("SQL_HOST"),
         "PORT": os.getenv("SQL_PORT", "5432"),
+        # Держим соединение между запросами; 0 — закрывать после каждого запроса (нужно для пула и ASGI,
+        # иначе каждый поток sync_to_async держит своё соединение), поэтому там 0 и по умолчанию
+        "CONN_MAX_AGE": int(os.getenv(
+            "SQL_CONN_MAX_AGE",
+            0 if SERVER_MODE == 'asgi' or os.getenv("SQL_ENGINE") == 'uasz_portal.db.postgresql_pool' else 60,
+        )),
+        # Перед повторным использованием соединения проверяем его SELECT 1 в начале запроса
+        "CONN_HEALTH_CHECKS": os.getenv("SQL_CONN_HEALTH_CHECKS", "True") == "True",
+        # Используется только с SQL_ENGINE=uasz_portal.db.postgresql_pool
+        "POOL": {
+            "MAX_SIZE": int(os.getenv("SQL_POOL_MAX_SIZE", 10)),
+            "TIMEOUT": float(os.getenv("SQL_POOL_TIMEOUT", 5)),
+            "MAX_AGE": int(os.getenv("SQL_POOL_MAX_AGE", 1800)),
+            "IDLE_CHECK": int(os.getenv("SQL_POOL_IDLE_CHECK", 30)),
+        },
     }
 }
 
@@ -173,9 +211,12 @@ SOCIAL_AUTH_GOOGLE_OAUTH2_SCOPE = [
 
 SOCIAL_AUTH_YANDEX_OAUTH2_KEY = os.getenv('SOCIAL_AUTH_YANDEX_OAUTH2_KEY')
 SOCIAL_AUTH_YANDEX_OAUTH2_SECRET =os.getenv('SOCIAL_AUTH_YANDEX_OAUTH2_SECRET')
+# Сертификаты Google для проверки ID-токенов и кеш userinfo провайдеров для /api/social/
+SOCIAL_GOOGLE_CERTS_LIFESPAN = int(os.getenv('SOCIAL_GOOGLE_CERTS_LIFESPAN', 3600))
+SOCIAL_USERINFO_CACHE_TIMEOUT = int(os.getenv('SOCIAL_USERINFO_CACHE_TIMEOUT', 60))
 
 #email
-EMAIL_BACKEND ='django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND =os.getenv('EMAIL_BACKEND', 'accounts.mail.PooledEmailBackend')
 EMAIL_HOST =os.getenv('EMAIL_HOST')
 EMAIL_PORT =int(os.getenv('EMAIL_PORT'))
 EMAIL_USE_TLS =True
@@ -183,6 +224,10 @@ EMAIL_USE_SSL = False
 EMAIL_HOST_USER =os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD =os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL =EMAIL_HOST_USER
+EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', 10))
+EMAIL_POOL_SIZE = int(os.getenv('EMAIL_POOL_SIZE', 4))
+EMAIL_POOL_MAX_AGE = int(os.getenv('EMAIL_POOL_MAX_AGE', 300))
+EMAIL_POOL_IDLE_CHECK = int(os.getenv('EMAIL_POOL_IDLE_CHECK', 30))
 
 
 #Simple_JWT
@@ -208,7 +253,7 @@ SIMPLE_JWT = {
     "USER_ID_CLAIM": "user_id",
     "USER_AUTHENTICATION_RULE": "rest_framework_simplejwt.authentication.default_user_authentication_rule",
 
-    "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
+    "AUTH_TOKEN_CLASSES": ("accounts.tokens.AccessToken",),
     "TOKEN_TYPE_CLAIM": "token_type",
     "TOKEN_USER_CLASS": "rest_framework_simplejwt.models.TokenUser",
 
@@ -218,14 +263,32 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_LIFETIME": timedelta(minutes=5),
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
 
-    "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    "TOKEN_OBTAIN_SERIALIZER": "accounts.serializers.TokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "accounts.serializers.TokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
     "SLIDING_TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSlidingSerializer",
 }
 
+# Каталог с закрытыми ключами RS256/EdDSA (manage.py generate_jwt_key); пусто — HS256 на SECRET_KEY
+JWT_KEYS_DIR = os.getenv('JWT_KEYS_DIR', '')
+# kid ключа для подписи; по умолчанию последний по имени файла
+JWT_SIGNING_KID = os.getenv('JWT_SIGNING_KID', '')
+JWKS_MAX_AGE = int(os.getenv('JWKS_MAX_AGE', 3600))
+
+USER_SNAPSHOT_TIMEOUT = int(os.getenv('USER_SNAPSHOT_TIMEOUT', 300))
+PROFILE_CACHE_TIMEOUT = int(os.getenv('PROFILE_CACHE_TIMEOUT', 300))
+# Пусто: RedisTokenState при кэше django_redis, иначе DatabaseTokenState
+TOKEN_STATE_BACKEND = os.getenv('TOKEN_STATE_BACKEND', '')
+
+#service api
+# Токены соседних сервисов: "billing=токен1,notifications=токен2"
+SERVICE_TOKENS = dict(
+    item.split('=', 1) for item in os.getenv('SERVICE_TOKENS', '').split(',') if '=' in item
+)
+SERVICE_LOOKUP_MAX_IDS = int(os.getenv('SERVICE_LOOKUP_MAX_IDS', 500))
+
 PHONENUMBER_DEFAULT_REGION = "BY"
 PHONENUMBER_DB_FORMAT = "INTERNATIONAL"
 
@@ -234,6 +297,51 @@ TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
 TWILIO_MOBILE_NUMBER=os.getenv('TWILIO_MOBILE_NUMBER')
 
+#sms
+SMS_BACKEND = os.getenv('SMS_BACKEND', 'accounts.sms.TwilioSMSBackend')
+SMS_MAX_CONCURRENCY = int(os.getenv('SMS_MAX_CONCURRENCY', 8))
+SMS_MAX_RETRIES = int(os.getenv('SMS_MAX_RETRIES', 2))
+SMS_TIMEOUT = float(os.getenv('SMS_TIMEOUT', 10))
+SMS_FAKE_LATENCY = float(os.getenv('SMS_FAKE_LATENCY', 0))
+
+#delivery queue
+CODE_DELIVERY_EAGER = os.getenv('CODE_DELIVERY_EAGER', 'False') == 'True'
+DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', 4))
+DELIVERY_BATCH_SIZE = int(os.getenv('DELIVERY_BATCH_SIZE', 50))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv('DELIVERY_MAX_ATTEMPTS', 5))
+DELIVERY_BACKOFF_BASE = int(os.getenv('DELIVERY_BACKOFF_BASE', 5))
+DELIVERY_BACKOFF_MAX = int(os.getenv('DELIVERY_BACKOFF_MAX', 300))
+DELIVERY_LOCK_TIMEOUT = int(os.getenv('DELIVERY_LOCK_TIMEOUT', 120))
+DELIVERY_JOB_RETENTION_HOURS = float(os.getenv('DELIVERY_JOB_RETENTION_HOURS', 24))
+
+#avatars
+AVATAR_MAX_UPLOAD_SIZE = int(os.getenv('AVATAR_MAX_UPLOAD_SIZE', 5 * 1024 * 1024))
+# Защита от "бомб": маленький файл с огромным разрешением
+AVATAR_MAX_PIXELS = int(os.getenv('AVATAR_MAX_PIXELS', 25_000_000))
+AVATAR_SIZES = {'small': 64, 'medium': 256}
+AVATAR_WORKERS = int(os.getenv('AVATAR_WORKERS', 2))
+# Задачу, не завершённую за это время (воркер перезапущен), доделывает run_delivery_worker
+AVATAR_LOCK_TIMEOUT = int(os.getenv('AVATAR_LOCK_TIMEOUT', 300))
+AVATAR_MAX_ATTEMPTS = int(os.getenv('AVATAR_MAX_ATTEMPTS', 3))
+FILE_UPLOAD_HANDLERS = [
+    'accounts.avatars.SizeLimitUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+#admin
+# До этого числа строк админка считает их точно, дальше берёт оценку планировщика PostgreSQL
+ADMIN_EXACT_COUNT_LIMIT = int(os.getenv('ADMIN_EXACT_COUNT_LIMIT', 10000))
+
+#metrics
+# Гистограммы по маршрутам на /metrics для Prometheus; при False middleware и хуки отключены
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False') == 'True'
+# Если задан, /metrics требует заголовок "Authorization: Bearer <токен>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Общий каталог для процессов gunicorn: каждый пишет туда свои гистограммы не чаще раза
+# в METRICS_FLUSH_INTERVAL секунд, /metrics их суммирует. Пусто - только процесс, ответивший на запрос
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
 
 SOCIAL_AUTH_PIPELINE = (
     'social_core.pipeline.social_auth.social_details',
@@ -245,7 +353,7 @@ SOCIAL_AUTH_PIPELINE = (
     'accounts.pipeline.activate_user',
     'social_core.pipeline.social_auth.associate_user',
     'social_core.pipeline.social_auth.load_extra_data',
-    'social_core.pipeline.user.user_details'
+    'accounts.pipeline.user_details'
 )
 
 LOGIN_REDIRECT_URL='/api/profile/'